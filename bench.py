@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import svgwrite
+
+import dial
+
+# Author: dlee@dlee.io / enkidu on watchuseek
+# Use of these files is free under the
+# [CC BY-SA 4.0](https://creativecommons.org/licenses/by-sa/4.0/) license.
+# Enjoy!
+
+# Benchmarks dial generation. Every case is generated with gen_dial, with
+# each stage timed (best of --repeat runs) and once more under tracemalloc
+# for the peak memory of each stage.
+#
+#   python bench.py --json results.json
+#   python bench.py --baseline results.json --threshold 0.25
+#   python bench.py --check-startup
+
+substep_counts = [1, 4, 8, 20, 100]
+radii = [250, 1000]
+dial_stages = ['construct', 'track', 'indices', 'hands', 'save']
+
+def default_dial(path, radius, substeps):
+  centerx = centery = radius + 200
+  drawing = svgwrite.Drawing(path, size=(centerx*2, centery*2),
+      profile='full', fill='black', stroke='black')
+  return dial.dial(drawing, (centerx, centery), radius, substeps=substeps)
+
+def mission_timer_dial(path, radius, substeps):
+  centerx = centery = radius + 200
+  drawing = svgwrite.Drawing(path, size=(centerx*2, centery*2),
+      profile='full', fill='black', stroke='none')
+  return dial.build_mission_timer(drawing, {
+      'size':(centerx*2, centery*2),
+      'center':(centerx, centery),
+      'radius':radius,
+      'substeps':substeps,
+      })
+
+dial_styles = {
+    'default':default_dial,
+    'mission-timer':mission_timer_dial,
+    }
+
+# the gen_dial stages that make up each benchmark stage
+stage_steps = {
+    'track':['define_track', 'gen_track'],
+    'indices':['define_indices', 'gen_indices'],
+    'hands':['define_hands', 'gen_hands'],
+    'save':['save'],
+    }
+
+def run_dial_case(style, path, radius, substeps):
+  '''one run of a dial case, returns the seconds per stage'''
+  times = {}
+  start = time.perf_counter()
+  d = dial_styles[style](path, radius, substeps)
+  times['construct'] = time.perf_counter() - start
+  d.set_params(instrument='time')
+  stages = d.gen_dial().stages
+  for stage, steps in stage_steps.items():
+    times[stage] = sum([stages[step]['seconds'] for step in steps])
+  return times
+
+def run_dial_case_memory(style, path, radius, substeps):
+  '''one run of a dial case under tracemalloc, returns the peak bytes per
+  stage'''
+  peaks = {}
+  tracemalloc.start()
+  try:
+    d = dial_styles[style](path, radius, substeps)
+    peaks['construct'] = tracemalloc.get_traced_memory()[1]
+    d.set_params(instrument=True)
+    stages = d.gen_dial().stages
+    for stage, steps in stage_steps.items():
+      peaks[stage] = max([stages[step]['peak_bytes'] for step in steps])
+  finally:
+    tracemalloc.stop()
+  return peaks
+
+def bench_dial(style, radius, substeps, tmp, repeat):
+  path = os.path.join(tmp, '%s-%d-%d.svg' % (style, radius, substeps))
+  runs = [run_dial_case(style, path, radius, substeps) for _ in range(repeat)]
+  seconds = dict([(stage, min([run[stage] for run in runs]))
+      for stage in dial_stages])
+  seconds['total'] = min([sum(run.values()) for run in runs])
+  peak = run_dial_case_memory(style, path, radius, substeps)
+  return {
+      'seconds':seconds,
+      'peak_bytes':peak,
+      'bytes':os.path.getsize(path),
+      }
+
+def bench_rerender(style, radius, substeps, tmp, repeat):
+  '''gen_dial after changing only the second hand of a generated dial'''
+  path = os.path.join(tmp, 'rerender-%s-%d-%d.svg' % (style, radius, substeps))
+  d = dial_styles[style](path, radius, substeps)
+  d.gen_dial()
+  hands = [d.dwg.rect((495,950), (10, 975)), d.dwg.rect((496,950), (8, 975))]
+  runs = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    d.set_params(sechand=hands[i % 2])
+    d.gen_dial()
+    runs.append(time.perf_counter() - start)
+  tracemalloc.start()
+  try:
+    d.set_params(sechand=hands[repeat % 2])
+    d.gen_dial()
+    peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+  return {
+      'seconds':{'total':min(runs)},
+      'peak_bytes':{'total':peak},
+      'bytes':os.path.getsize(path),
+      }
+
+def example_workloads(quick):
+  sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+  import example
+  workloads = {
+      'koch_snowflake':example.koch_snowflake,
+      'mandelbrot':example.mandelbrot,
+      'lsystem_levydragon':lambda name: example.LSystem(name, example.LevyDragon),
+      }
+  if not quick:
+    workloads['lsystem_levycurve'] = lambda name: example.LSystem(name, example.LevyCurve)
+  return workloads
+
+def bench_example(name, function, tmp):
+  path = os.path.join(tmp, name + '.svg')
+  start = time.perf_counter()
+  function(path)
+  seconds = time.perf_counter() - start
+  tracemalloc.start()
+  try:
+    function(path)
+    peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+  return {
+      'seconds':{'total':seconds},
+      'peak_bytes':{'total':peak},
+      'bytes':os.path.getsize(path),
+      }
+
+def run(repeat=3, quick=False, examples=True):
+  results = {}
+  tmp = tempfile.mkdtemp(prefix='dial-bench-')
+  try:
+    for style in sorted(dial_styles):
+      for radius in radii:
+        for substeps in substep_counts:
+          name = 'dial/%s/r%d/s%d' % (style, radius, substeps)
+          results[name] = bench_dial(style, radius, substeps, tmp, repeat)
+          report(name, results[name])
+    for radius in radii:
+      name = 'rerender/default/r%d/s20' % radius
+      results[name] = bench_rerender('default', radius, 20, tmp, repeat)
+      report(name, results[name])
+    if examples:
+      cwd = os.getcwd()
+      os.chdir(tmp)
+      try:
+        for name, function in sorted(example_workloads(quick).items()):
+          results['example/' + name] = bench_example(name, function, tmp)
+          report('example/' + name, results['example/' + name])
+      finally:
+        os.chdir(cwd)
+  finally:
+    shutil.rmtree(tmp)
+  return results
+
+def report(name, result):
+  print('%-32s %9.4fs %10d bytes peak %9d bytes out' % (name,
+      result['seconds']['total'], max(result['peak_bytes'].values()),
+      result['bytes']))
+
+# run in a fresh interpreter: the import of dial and the construction of a
+# dial that is given all of its units, as mission-timer.py does
+startup_script = '''
+import json, sys, time
+start = time.perf_counter()
+import dial
+imported = time.perf_counter() - start
+heavy = [name for name in ('svgwrite', 'numpy') if name in sys.modules]
+import svgwrite
+drawing = svgwrite.Drawing('startup.svg')
+units = dict((key, drawing.g()) for key in dial.default_units)
+start = time.perf_counter()
+for _ in range(100):
+  dial.dial(drawing, (1200, 1200), 1000, **units)
+constructed = (time.perf_counter() - start) / 100
+print(json.dumps({'import':imported, 'construct':constructed, 'heavy':heavy}))
+'''
+
+def check_startup(import_budget, construct_budget, repeat=3):
+  '''
+  the list of startup budgets that are exceeded: the import of dial has to
+  take at most import_budget seconds and must not pull in svgwrite or numpy,
+  constructing a dial at most construct_budget seconds.
+  '''
+  here = os.path.dirname(os.path.abspath(__file__))
+  runs = []
+  for _ in range(repeat):
+    out = subprocess.check_output([sys.executable, '-c', startup_script],
+        cwd=here)
+    runs.append(json.loads(out))
+  imported = min([run['import'] for run in runs])
+  constructed = min([run['construct'] for run in runs])
+  print('%-32s %9.4fs' % ('startup/import', imported))
+  print('%-32s %9.6fs' % ('startup/construct', constructed))
+  failures = []
+  if imported > import_budget:
+    failures.append('import of dial took %gs, budget %gs' % (imported,
+        import_budget))
+  if constructed > construct_budget:
+    failures.append('dial construction took %gs, budget %gs' % (
+        constructed, construct_budget))
+  for name in runs[0]['heavy']:
+    failures.append('import of dial imports %s' % name)
+  return failures
+
+def compare(results, baseline, threshold, min_seconds=0.002):
+  '''
+  the list of regressions of results against baseline, where a time, peak
+  or size grew by more than threshold (a fraction). Times also have to grow
+  by min_seconds, shorter stages are too noisy to compare.
+  '''
+  regressions = []
+  for name, result in sorted(results.items()):
+    old = baseline.get(name)
+    if old is None:
+      continue
+    pairs = [('seconds.' + k, v, old['seconds'].get(k))
+        for k, v in result['seconds'].items()]
+    pairs += [('peak_bytes.' + k, v, old['peak_bytes'].get(k))
+        for k, v in result['peak_bytes'].items()]
+    pairs.append(('bytes', result['bytes'], old['bytes']))
+    for metric, new, before in pairs:
+      if not before or new <= before * (1 + threshold):
+        continue
+      if metric.startswith('seconds.') and new - before < min_seconds:
+        continue
+      regressions.append((name, metric, before, new))
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description='benchmark dial generation')
+  parser.add_argument('--json', help='write the results to this file')
+  parser.add_argument('--baseline', help='compare against these results')
+  parser.add_argument('--threshold', type=float, default=0.25,
+      help='allowed growth against the baseline, default 0.25')
+  parser.add_argument('--min-seconds', type=float, default=0.002,
+      help='ignore time regressions smaller than this, default 0.002')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--quick', action='store_true',
+      help='skip the slowest example workload')
+  parser.add_argument('--no-examples', action='store_true',
+      help='only benchmark dials')
+  parser.add_argument('--check-startup', action='store_true',
+      help='only check the import and construction time budgets')
+  parser.add_argument('--import-budget', type=float, default=0.1,
+      help='seconds allowed for importing dial, default 0.1')
+  parser.add_argument('--construct-budget', type=float, default=0.001,
+      help='seconds allowed for constructing a dial, default 0.001')
+  args = parser.parse_args()
+
+  if args.check_startup:
+    failures = check_startup(args.import_budget, args.construct_budget,
+        args.repeat)
+    for failure in failures:
+      print('OVER BUDGET %s' % failure)
+    if failures:
+      sys.exit(1)
+    return
+
+  results = run(args.repeat, args.quick, not args.no_examples)
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold,
+        args.min_seconds)
+    for name, metric, before, new in regressions:
+      print('REGRESSION %s %s: %g -> %g' % (name, metric, before, new))
+    if regressions:
+      sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -1,7 +1,15 @@
-import svgwrite
 import math
 from math import pi
 import datetime
+import io
+import collections
+import functools
+import itertools
+import os
+import re
+import sys
+import time
+import weakref
 
 # Author: dlee@dlee.io / enkidu on watchuseek
 # Use of these files is free under the
@@ -45,7 +53,17 @@ def calc_flat_inset(radius, gap):
   inset = radius - math.sqrt((radius * radius) - (gap * gap))
   return inset
 
-def draw_tapered_index(d, g, o_radius, height, angle, flat, **opts):
+def draw_tapered_index(d, g, o_radius, height, angle, flat, precision=None,
+    **opts):
+  for p in index_paths(o_radius, None, height, angle, flat, precision):
+    g.add(d.path(p, **opts))
+
+def draw_split_tapered_index(d, g, o_radius, gap, height, angle, flat,
+    precision=None, **opts):
+  for p in index_paths(o_radius, gap, height, angle, flat, precision):
+    g.add(d.path(p))
+
+def tapered_index_commands(o_radius, height, angle, flat):
   base_width, base_inset = calc_width_and_inset(o_radius, angle)
   top_width = calc_flat_width(o_radius - height, angle)
   p = []
@@ -57,9 +75,9 @@ def draw_tapered_index(d, g, o_radius, height, angle, flat, **opts):
   p.extend(['l', (top_width - base_width, height - base_inset)])
   p.extend(['l', (-2 * top_width, 0)])
   p.extend(['z'])
-  g.add(d.path(p, **opts))
+  return p
 
-def draw_split_tapered_index(d, g, o_radius, gap, height, angle, flat, **opts):
+def split_tapered_index_commands(o_radius, gap, height, angle, flat):
   base_width, base_inset = calc_width_and_inset(o_radius, angle)
   top_width, top_inset = calc_width_and_inset(o_radius - height, angle)
   base_gap_inset = calc_flat_inset(o_radius, gap)
@@ -80,8 +98,213 @@ def draw_split_tapered_index(d, g, o_radius, gap, height, angle, flat, **opts):
   pl.extend(['l', (base_width - top_width, height - base_inset)])
   pr.extend(['l', (gap - top_width, 0), 'z'])
   pl.extend(['l', (top_width - gap, 0), 'z'])
-  g.add(d.path(pr))
-  g.add(d.path(pl))
+  return pr, pl
+
+def _index_paths(o_radius, gap, height, angle, flat, precision=None):
+  '''
+  path data of a tapered index, or of the two halves of a split tapered
+  index if gap is not None, as a tuple of path strings.
+  '''
+  if gap is None:
+    paths = [tapered_index_commands(o_radius, height, angle, flat)]
+  else:
+    paths = split_tapered_index_commands(o_radius, gap, height, angle, flat)
+  return tuple([format_path(p, precision) for p in paths])
+
+index_paths = functools.lru_cache(maxsize=256)(_index_paths)
+
+def geometry_cache_info():
+  '''hits, misses, maxsize and currsize of the index path cache'''
+  return index_paths.cache_info()
+
+def set_geometry_cache_size(maxsize):
+  '''replaces the index path cache with an empty one of maxsize entries'''
+  global index_paths
+  index_paths = functools.lru_cache(maxsize=maxsize)(_index_paths)
+
+# the svgwrite elements of the default dial, only built for the units a dial
+# is not given
+default_units = {
+    'track': lambda dwg: dwg.circle(center=(1000,1000),r=1000,stroke='black',fill='none'),
+    'top':   lambda dwg: dwg.rect((475,0), (50, 250)),
+    'major': lambda dwg: dwg.rect((480,0), (40, 250)),
+    'hour':  lambda dwg: dwg.rect((490,0), (20, 125)),
+    'minute':lambda dwg: dwg.rect((498,0), (4, 50)),
+    'sub':   lambda dwg: dwg.rect((499,0), (2, 25)),
+    'hourhand':lambda dwg: dwg.rect((480,980), (40, 370)),
+    'minhand': lambda dwg: dwg.rect((490,980), (20, 720)),
+    'sechand': lambda dwg: dwg.rect((495,950), (10, 975)),
+    }
+
+default_params = {
+    'dtime':datetime.time(10,9,29,200000),
+    'substeps':4,
+    'minute_skip':None,
+    'index_rules':None,
+    'divisions':60,
+    'animate':None,
+    'precision':None,
+    'stream':None,
+    'compresslevel':None,
+    'instrument':None,
+    'bake':None,
+    'symmetry':None,
+    'gmthand':None,
+    'dayhand':None,
+    'chronohand':None,
+    'gmt_offset':0,
+    'chrono_start':None,
+    }
+
+# the hands, see hand_angles. Only hour, minute and second hands have a
+# default unit.
+hand_names = ['hourhand', 'minhand', 'sechand', 'gmthand', 'dayhand',
+    'chronohand']
+index_names = ['sub', 'minute', 'hour', 'major', 'top']
+
+# the index rules of the default dial, see index_table
+default_index_rules = [
+    {'unit':'sub'},
+    {'unit':'minute', 'every':1},
+    {'unit':'hour', 'every':5},
+    {'unit':'major', 'every':15},
+    {'unit':'top', 'at':0},
+    ]
+
+# an index kind without a unit is drawn with the unit of the next smaller one
+unit_overrides = dict(zip(index_names[1:], index_names[:-1]))
+
+# the serialized parts of a dial in document order, the defs groups and the
+# bodies that reference them
+def_parts = ['defs:' + name for name in ['track'] + index_names + hand_names]
+body_parts = ['track', 'indices'] + hand_names
+
+def param_parts(key, presence_changed=True):
+  '''
+  the serialized parts of a dial that change with the parameter key. The
+  bodies only reference the units by id, so a changed unit only changes
+  them if it was added or removed.
+  '''
+  if key == 'track':
+    return ['defs:track'] + ['track'] * presence_changed
+  if key in index_names:
+    parts = ['defs:' + name for name in index_names[index_names.index(key):]]
+    return parts + ['indices'] * presence_changed
+  if key in hand_names:
+    return ['defs:' + key] + [key] * presence_changed
+  if key == 'bake':
+    return ['defs:' + name for name in index_names] + ['indices']
+  if key in ('minute_skip', 'symmetry', 'index_rules', 'divisions'):
+    return ['indices']
+  if key == 'substeps':
+    return ['indices', 'sechand', 'chronohand']
+  if key in ('dtime', 'animate'):
+    return list(hand_names)
+  if key == 'gmt_offset':
+    return ['gmthand']
+  if key == 'chrono_start':
+    return ['chronohand']
+  if key == 'precision':
+    return list(body_parts)
+  return []
+
+class placed(object):
+  '''
+  a unit placed on a dial, the record the backends work from: the unit
+  name ('track', 'top', 'major', 'hour', 'minute', 'sub' or a hand name),
+  the rotation in degrees, the scale and the translation x, y. See
+  placement_matrix for how rotated units turn around the center of the
+  dial at (500, 1000) in their box.
+  '''
+  __slots__ = ('unit', 'angle', 'scale', 'x', 'y')
+
+  def __init__(self, unit, angle, scale, x, y):
+    self.unit = unit
+    self.angle = angle
+    self.scale = scale
+    self.x = x
+    self.y = y
+
+  def matrix(self):
+    '''the svg matrix(a,b,c,d,e,f) of the placement'''
+    cos = self.scale * math.cos(math.radians(self.angle))
+    sin = self.scale * math.sin(math.radians(self.angle))
+    return (cos, sin, -sin, cos, self.x, self.y)
+
+  def astuple(self):
+    return (self.unit, self.angle, self.scale, self.x, self.y)
+
+  def __eq__(self, other):
+    return isinstance(other, placed) and self.astuple() == other.astuple()
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'placed(%r, %r, %r, %r, %r)' % self.astuple()
+
+class defs_registry(object):
+  '''
+  the unit groups of all the dials on one drawing, by name and serialized
+  content. Dials with the same unit share one group, a unit is only put
+  in the defs once however many dials use it. The first group of a name
+  gets the name as its id, the ones after it the name and a hash of their
+  content. A group is dropped when the last dial using it releases it.
+  '''
+  def __init__(self, dwg):
+    self.dwg = dwg
+    self.groups = {}
+    self.users = {}
+    self.ids = {}
+
+  def unique_id(self, name, owner):
+    '''an id for the element name of owner that no other owner gets, name
+    itself for the first one'''
+    if (name, owner) not in self.ids:
+      taken = set(self.ids.values())
+      unique, n = name, 2
+      while unique in taken:
+        unique, n = '%s-%d' % (name, n), n + 1
+      self.ids[name, owner] = unique
+    return self.ids[name, owner]
+
+  def acquire(self, name, element, owner):
+    '''the group holding element under name, created if no dial has it'''
+    import hashlib
+    data = '%s\0%s' % (name, element.tostring())
+    key = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    group = self.groups.get(key)
+    if group is None:
+      ids = set([g['id'] for g in self.groups.values()])
+      group = self.dwg.g(id=name if name not in ids else
+          '%s-%s' % (name, key[:8]))
+      group.add(element)
+      self.groups[key] = group
+      self.users[key] = set()
+    self.users[key].add(owner)
+    return group
+
+  def release(self, group, owner):
+    '''owner stops using group, True if that was the last user'''
+    for key, g in self.groups.items():
+      if g is group:
+        self.users[key].discard(owner)
+        if not self.users[key]:
+          del self.groups[key], self.users[key]
+          return True
+        return False
+    return False
+
+_registries = weakref.WeakKeyDictionary()
+
+def drawing_registry(dwg):
+  '''the defs_registry of the drawing dwg'''
+  registry = _registries.get(dwg)
+  if registry is None:
+    registry = _registries[dwg] = defs_registry(dwg)
+  return registry
 
 class dial:
   '''
@@ -95,149 +318,831 @@ class dial:
     self.dwg = dwg
     self.center = center
     self.radius = radius
-    self.defaults = {
-        'track':self.dwg.circle(center=(1000,1000),r=1000,stroke='black',fill='none'),
-        'dtime':datetime.time(10,9,29,200000),
-        'top':   self.dwg.rect((475,0), (50, 250)),
-        'major': self.dwg.rect((480,0), (40, 250)),
-        'hour':  self.dwg.rect((490,0), (20, 125)),
-        'minute':self.dwg.rect((498,0), (4, 50)),
-        'sub':   self.dwg.rect((499,0), (2, 25)),
-        'substeps':4,
-        'hourhand':self.dwg.rect((480,980), (40, 370)),
-        'minhand': self.dwg.rect((490,980), (20, 720)),
-        'sechand': self.dwg.rect((495,950), (10, 975)),
-        'minute_skip':None,
-        }
+    self.defaults = default_params.copy()
+    self._out = None
+    self._stats = None
+    self._groups = {}
+    self._parts = {}
+    self._elements = {}
+    self._counts = {}
+    self._masks = None
+    self._dirty = set(def_parts + body_parts)
     self.set_params(**dict)
 
   def set_param(self, key, **dict):
-    self.__dict__[key] = dict.get(key, self.defaults[key])
+    old = getattr(self, key, None)
+    if key in dict:
+      setattr(self, key, dict[key])
+    elif key in default_units:
+      setattr(self, key, default_units[key](self.dwg))
+    else:
+      setattr(self, key, self.defaults[key])
+    self._dirty.update(param_parts(key, bool(old) != bool(getattr(self, key))))
+    if key in index_names:
+      # the raster masks of replaced units are never used again
+      self._masks = None
+      if getattr(self, 'bake', None):
+        # baked indices hold the geometry of the units
+        self._dirty.add('indices')
 
   def set_params(self, **dict):
-    for k in self.defaults.keys():
-      if not self.__dict__.get(k):
-        self.set_param(k, **dict)
-      elif dict.has_key(k):
+    '''
+    sets the parameters in dict and the defaults of the ones that were never
+    set. Only the parts of the dial that depend on them are regenerated by
+    the next gen_dial.
+    '''
+    for k in itertools.chain(default_units, self.defaults):
+      if k in dict or not hasattr(self, k):
         self.set_param(k, **dict)
 
+  def invalidate(self):
+    '''regenerate everything on the next gen_dial, e.g. after changing
+    center or radius or the units themselves'''
+    self._dirty.update(def_parts + body_parts)
+    self._masks = None
+
   def gen_dial(self):
-    self.define_track()
-    self.gen_track()
+    '''
+    generates the dial and saves the drawing, or writes it to self.stream.
+    With compresslevel set the output is gzip compressed (svgz) while it is
+    written. The drawing holds the dial afterwards, see add_to_drawing,
+    but only the changed parts are serialized again. Returns a dial_stats
+    if instrument is set, else None.
+    '''
+    if self.instrument:
+      self._stats = dial_stats(self.instrument)
+    try:
+      if self.stream is not None or self.compresslevel is not None:
+        self.gen_dial_stream()
+      else:
+        self.run_stage('define_track', lambda: self.update_defs(['track']))
+        self.run_stage('gen_track', lambda: self.update_part('track',
+            self.track_parts))
 
-    self.define_indices()
-    self.gen_indices()
+        self.run_stage('define_indices', lambda: self.update_defs(index_names))
+        self.run_stage('gen_indices', lambda: self.update_part('indices',
+            self.index_parts))
 
-    self.define_hands()
-    self.gen_hands()
-    self.dwg.save()
+        self.run_stage('define_hands', lambda: self.update_defs(hand_names))
+        self.run_stage('gen_hands', self.update_hands)
+        if self._stats is not None:
+          for part in body_parts:
+            self._stats.elements.update(self._counts[part])
+        self.run_stage('save', self.save)
+        if self._stats is not None:
+          self._stats.bytes_written += os.path.getsize(self.dwg.filename)
+      return self._stats and self._stats.finish()
+    finally:
+      if self._stats is not None:
+        self._stats.stop()
+      self._stats = None
+
+  def run_stage(self, name, step):
+    '''runs step as the stage name of gen_dial, measured if instrumented'''
+    if self._stats is None:
+      step()
+    else:
+      self._stats.run_stage(name, step)
+
+  def gen_dial_stream(self):
+    '''
+    write the dial straight to the binary file-like object self.stream, or
+    the drawing's file if there is none. The defs are added to the drawing
+    and written first, every index and hand is then written as soon as it
+    is generated instead of being added to the drawing. With compresslevel
+    set everything goes through a gzip compressor on the way.
+    '''
+    self.run_stage('define_track', lambda: self.update_defs(['track']))
+    self.run_stage('define_indices', lambda: self.update_defs(index_names))
+    self.run_stage('define_hands', lambda: self.update_defs(hand_names))
+    head, tail = self.document([])
+    stream = self.stream
+    if stream is None:
+      stream = open(self.dwg.filename, 'wb')
+    sink = stream
+    if self._stats is not None:
+      sink = counting_writer(stream, self._stats)
+    try:
+      if self.compresslevel is not None:
+        import gzip
+        self._out = gzip.GzipFile(fileobj=sink, mode='wb',
+            compresslevel=self.compresslevel, mtime=0)
+      else:
+        self._out = sink
+      try:
+        self.write(head)
+        self.run_stage('gen_track', self.gen_track)
+        self.run_stage('gen_indices', self.gen_indices)
+        self.run_stage('gen_hands', self.gen_hands)
+        self.write(tail)
+      finally:
+        if self._out is not sink:
+          self._out.close()
+        self._out = None
+    finally:
+      if stream is not self.stream:
+        stream.close()
+
+  def render_bytes(self, compresslevel=None):
+    '''
+    the dial as svg bytes, or gzip compressed svgz bytes if compresslevel
+    is set, without writing a file
+    '''
+    buf = io.BytesIO()
+    stream, level = self.stream, self.compresslevel
+    self.stream, self.compresslevel = buf, compresslevel
+    try:
+      self.gen_dial()
+    finally:
+      self.stream, self.compresslevel = stream, level
+    return buf.getvalue()
+
+  def write(self, data):
+    '''writes data to the output while streaming'''
+    self._out.write(data)
+
+  def emit(self, element, kind=None):
+    '''adds element to the drawing, or writes it out while streaming. kind
+    is what gets counted when instrumented.'''
+    if self._stats is not None and kind is not None:
+      self._stats.elements[kind] += 1
+    if self._out is None:
+      self.dwg.add(element)
+    else:
+      self.write(element.tostring().encode('utf-8'))
+
+  def update_defs(self, names):
+    '''puts the groups of the unit names with dirty defs in the defs of the
+    drawing'''
+    for name in names:
+      if 'defs:' + name not in self._dirty:
+        continue
+      old = self._groups.get(name)
+      self.add_name_to_drawing_defs(name, unit_overrides.get(name))
+      group = self._groups[name]
+      if (old is not None and group is not None
+          and old.get_id() != group.get_id()):
+        # the group moved to another id, the body referencing it follows
+        self._dirty.add(name if name in hand_names
+            else 'indices' if name in index_names else 'track')
+      self._parts['defs:' + name] = (group is not None
+          and group.tostring().encode('utf-8') or b'')
+      self._dirty.discard('defs:' + name)
+
+  def update_part(self, part, parts):
+    '''
+    the elements of the (kind, element) pairs from parts become the body
+    part, if it is dirty: they replace the ones before in the drawing, are
+    serialized and counted by kind
+    '''
+    if part not in self._dirty:
+      return
+    elements, counts = [], collections.Counter()
+    for kind, element in parts():
+      if kind is not None:
+        counts[kind] += 1
+      elements.append(element)
+    self._parts[part] = b''.join([element.tostring().encode('utf-8')
+        for element in elements])
+    self._counts[part] = counts
+    self.place_part(part, elements)
+    self._dirty.discard(part)
+
+  def place_part(self, part, elements):
+    '''puts elements in the drawing in place of the ones of the body part,
+    or next to the other parts in document order'''
+    body = self.dwg.elements
+    old = set(map(id, self._elements.get(part, [])))
+    position = None
+    for i, element in enumerate(body):
+      if id(element) in old:
+        position = i
+        break
+    if old:
+      body[:] = [element for element in body if id(element) not in old]
+    if position is None:
+      present = set(map(id, body))
+      index = body_parts.index(part)
+      before = [e for p in body_parts[:index] for e in self._elements.get(p, [])
+          if id(e) in present]
+      after = [e for p in body_parts[index + 1:]
+          for e in self._elements.get(p, []) if id(e) in present]
+      position = len(body)
+      if before:
+        position = _index_of(body, before[-1]) + 1
+      elif after:
+        position = _index_of(body, after[0])
+    body[position:position] = elements
+    self._elements[part] = elements
+
+  def update_hands(self):
+    for name in hand_names:
+      self.update_part(name, lambda: [('hand', hand)
+          for hand_name, hand in self.hand_parts([name])])
+
+  def document(self, bodies):
+    '''
+    the serialized drawing with the serialized bodies spliced in where the
+    body elements of the dial are, at the end if it has none, as a list of
+    byte strings: the drawing up to there, the bodies and the rest of the
+    drawing.
+    '''
+    body = [e for part in body_parts for e in self._elements.get(part, [])]
+    prefix, middle, tail = split_drawing(self.dwg, body)
+    if prefix.endswith(b'<defs>') and middle.startswith(b'</defs>'):
+      prefix, middle = prefix[:-6], b'<defs />' + middle[7:]
+    return [prefix + middle] + list(bodies) + [tail]
+
+  def save(self):
+    '''writes the serialized dial to the file of the drawing'''
+    with open(self.dwg.filename, 'wb') as f:
+      for chunk in self.document([self._parts[part] for part in body_parts]):
+        f.write(chunk)
+
+  def render_frames(self, times, path_pattern):
+    '''
+    write one svg file per time in times. The track and indices are only
+    generated and serialized once, each frame then only adds the hands.
+    path_pattern is formatted with the frame number, e.g. 'frame-%05d.svg'.
+    Returns the list of written paths.
+    '''
+    head, tail = self.static_layer()
+    paths = []
+    for frame, dtime in enumerate(times):
+      path = path_pattern % frame
+      with open(path, 'wb') as f:
+        f.write(head)
+        f.write(self.hand_bytes(dtime))
+        f.write(tail)
+      paths.append(path)
+    return paths
+
+  def render_atlas(self, times, path, columns=None, margin=0,
+      index_path=None):
+    '''
+    write one svg with a grid of cells, one per time in times, e.g. the
+    clock_times of a watch face app. The defs, track and indices are in the
+    document once, as the group 'dial-static', each cell only references it
+    and adds its hands. A cell is the box of the dial grown by margin, the
+    grid has columns cells per row, about square if None. Returns the index
+    of the atlas, the cell of every time as [x, y, width, height] by its
+    isoformat, and writes it as json to index_path if that is given.
+    '''
+    import json
+    import svgwrite
+    self.update_defs(['track'] + index_names + hand_names)
+    self.update_part('track', self.track_parts)
+    self.update_part('indices', self.index_parts)
+    if columns is None:
+      columns = max(1, int(math.ceil(math.sqrt(len(times)))))
+    rows = max(1, (len(times) + columns - 1) // columns)
+    x0 = self.center[0] - self.radius - margin
+    y0 = self.center[1] - self.radius - margin
+    size = 2 * (self.radius + margin)
+    atlas = svgwrite.Drawing(path, size=(columns * size, rows * size),
+        profile=self.dwg._parameter.profile)
+    for name, value in self.dwg.attribs.items():
+      if name not in ('width', 'height', 'viewBox'):
+        atlas[name] = value
+    prefix, middle, tail = split_drawing(atlas)
+    defs = b''.join([self._parts[part] for part in def_parts])
+    static = (b'<g id="dial-static">' + self._parts['track']
+        + self._parts['indices'] + b'</g>')
+    cells = {}
+    fmt = str if self.precision is None else number_formatter(self.precision)
+    with open(path, 'wb') as f:
+      f.write(prefix + defs + static + middle)
+      for i, dtime in enumerate(times):
+        x, y = (i % columns) * size, (i // columns) * size
+        cells[dtime.isoformat()] = [x, y, size, size]
+        f.write(('<g transform="translate(%s,%s)">'
+            '<use xlink:href="#dial-static" />' % (fmt(x - x0), fmt(y - y0))
+            ).encode('utf-8'))
+        f.write(self.hand_bytes(dtime))
+        f.write(b'</g>')
+      f.write(tail)
+    index = {'size':[columns * size, rows * size], 'cells':cells}
+    if index_path is not None:
+      with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    return index
+
+  def static_layer(self):
+    '''
+    generates the track and indices and defines the hands, and returns the
+    serialized drawing split in front of the closing svg tag. The hands of
+    any time can then be put in between, see hand_bytes.
+    '''
+    self.update_defs(['track'] + index_names + hand_names)
+    self.update_part('track', self.track_parts)
+    self.update_part('indices', self.index_parts)
+    chunks = self.document([self._parts['track'], self._parts['indices']])
+    return b''.join(chunks[:-1]), chunks[-1]
+
+  def hand_bytes(self, dtime):
+    '''the serialized hand elements for dtime'''
+    return b''.join([hand.tostring().encode('utf-8')
+        for hand in self.hand_elements(dtime)])
 
   def define_track(self):
     self.add_name_to_drawing_defs('track')
 
   def gen_track(self):
-    if not self.track:
-      return
-    track = self.dwg.use(self.track)
-    track.translate(
-        self.center[0] - self.radius,
-        self.center[1] - self.radius
-        )
-    track.scale(1.0 * self.radius / 1000)
-    self.dwg.add(track)
+    for kind, track in self.track_parts():
+      self.emit(track, kind)
 
+  def track_parts(self):
+    '''(kind, element) of the track'''
+    track = self.refs()['track']
+    if not track:
+      return []
+    return [('track', self.use_element(track, self.track_placement()))]
 
   def define_indices(self):
     '''Adds definitions to the dial for top, major, hour, minute and sub
     indices'''
     previous=None
-    for index_name in ['sub', 'minute', 'hour', 'major', 'top']:
+    for index_name in index_names:
       self.add_name_to_drawing_defs(index_name, previous)
       previous = index_name
 
   def gen_indices(self):
     '''
-    draw dial indices.
+    draw dial indices. By default
       top at the 12 o'clock position,
       major at the 3,6,9 positions,
       hour at the remaining hour positions,
       minute at the remaining minute positions,
       sub at the sub-minute positions.
+    index_rules changes this, see index_table.
     '''
-    substeps = self.substeps
-    for i in range(0, 60 * substeps):
-      angle = 6.0 * i / substeps;
-      hour, minute = get_hour_minute_from_angle(angle)
-      if (i == 0):
-        # top marker
-        self.gen_index(self.top, angle)
-        continue
-      elif (i % (3 * 5 * substeps) == 0):
-        # 3-6-9 case
-        self.gen_index(self.major, angle)
-        continue
-      elif (i % (5 * substeps) == 0):
-        # hour case
-        self.gen_index(self.hour, angle)
-        continue
-      elif (i % substeps == 0):
-        # min case
-        if int(minute) in self.minute_skip:
-          continue
-        self.gen_index(self.minute, angle)
-        continue
-      else:
-        self.gen_index(self.sub, angle)
+    for kind, index in self.index_parts():
+      self.emit(index, kind)
+
+  def index_parts(self):
+    '''(kind, element) of every index, or of the baked paths if bake is
+    set'''
+    if self.bake:
+      for part in self.baked_index_parts():
+        yield part
+      return
+    if self.symmetry:
+      for part in self.symmetric_index_parts():
+        yield part
+      return
+    refs = self.refs()
+    for p in self.index_placements():
+      if refs[p.unit]:
+        yield p.unit, self.use_element(refs[p.unit], p)
+
+  def symmetric_index_parts(self):
+    '''
+    (kind, element) of the indices drawn as one sector of the ring, the
+    group with the id 'sector' ('sector-2', ... for the other dials on the
+    drawing), and rotated use copies of it, see
+    ring_symmetry. The indices that differ between the sectors follow one
+    by one.
+    '''
+    refs = self.refs()
+    n = self.divisions * self.substeps
+    sequence, by_position = [None] * n, {}
+    for p in self.index_placements():
+      if refs[p.unit]:
+        i = int(round(p.angle * n / 360.0))
+        sequence[i] = p.unit
+        by_position[i] = p
+    symmetry = ring_symmetry(tuple(sequence))
+    if symmetry is None:
+      period, variable = n, frozenset(range(n))
+    else:
+      period, variable = symmetry
+    sector = self.dwg.g(
+        id=drawing_registry(self.dwg).unique_id('sector', id(self)))
+    for i in range(period):
+      if i not in variable and i in by_position:
+        p = by_position[i]
+        sector.add(self.use_element(refs[p.unit], p))
+    if sector.elements:
+      yield 'sector', sector
+      copies = n // period
+      for k in range(1, copies):
+        copy = self.dwg.use(sector)
+        angle = 360.0 * k / copies
+        if self.precision is None:
+          copy.rotate(angle, self.center)
+        else:
+          fmt = number_formatter(self.precision)
+          copy['transform'] = 'rotate(%s %s %s)' % (fmt(angle),
+              fmt(self.center[0]), fmt(self.center[1]))
+        yield 'sector', copy
+    for i in sorted(by_position):
+      if i % period in variable:
+        p = by_position[i]
+        yield p.unit, self.use_element(refs[p.unit], p)
+
+  def baked_index_parts(self):
+    '''
+    (kind, path) of every index kind, with the geometry of all its indices
+    placed and merged into one compound path, or one per style if its unit
+    mixes fills or strokes. Coordinates get self.precision decimals, 3 if
+    it is not set.
+    '''
+    units = self.units()
+    inherited = drawing_style(self.dwg)
+    fmt = number_formatter(3 if self.precision is None else self.precision)
+    unit_shapes = {}
+    paths = collections.OrderedDict()
+    for p in self.index_placements():
+      unit = units[p.unit]
+      if not unit:
         continue
+      if p.unit not in unit_shapes:
+        unit_shapes[p.unit] = element_shapes(unit, identity, inherited)
+      matrix = p.matrix()
+      for unit_shape in unit_shapes[p.unit]:
+        placed_shape = transform_shape(unit_shape, matrix)
+        key = (p.unit, placed_shape.fill, placed_shape.stroke,
+            fmt(placed_shape.stroke_width), placed_shape.fill_rule)
+        paths.setdefault(key, []).extend(placed_shape.commands)
+    for kind in reversed(index_names):
+      for key, commands in paths.items():
+        if key[0] == kind:
+          yield kind, self.baked_path(commands, key[1:], inherited, fmt)
+
+  def baked_path(self, commands, style, inherited, fmt):
+    '''a path element of commands, with the (fill, stroke, stroke width,
+    fill rule) of style that differ from the inherited style set'''
+    fill, stroke, stroke_width, fill_rule = style
+    attribs = {}
+    if fill != inherited['fill']:
+      attribs['fill'] = fill
+    if stroke != inherited['stroke']:
+      attribs['stroke'] = stroke
+    if (stroke != 'none'
+        and stroke_width != fmt(_length(inherited['stroke-width'], 1.0))):
+      attribs['stroke_width'] = stroke_width
+    if fill_rule != inherited['fill-rule']:
+      attribs['fill_rule'] = fill_rule
+    return self.dwg.path(d=command_path(commands, fmt), **attribs)
+
+  def units(self):
+    '''the element of every unit name. Index kinds without an element fall
+    back to the next smaller kind like define_indices.'''
+    units, previous = {}, None
+    for index_name in index_names:
+      units[index_name] = getattr(self, index_name) or previous
+      previous = units[index_name]
+    for name in ['track'] + hand_names:
+      units[name] = getattr(self, name)
+    return units
+
+  def refs(self):
+    '''the element every unit is used by, its defs group once it is
+    defined'''
+    refs = self.units()
+    refs.update(self._groups)
+    return refs
+
+  def layout(self, dtime=None):
+    '''
+    the placed units of the whole dial, track, indices and the hands at
+    dtime (default self.dtime), leaving out units without an element. This
+    is all the geometry of the dial, the backends turn it into svg or
+    pixels.
+    '''
+    if dtime is None:
+      dtime = self.dtime
+    units = self.units()
+    placements = [self.track_placement()]
+    placements.extend(self.index_placements())
+    placements.extend(self.hand_placements(dtime))
+    return [p for p in placements if units[p.unit]]
+
+  def track_placement(self):
+    '''the placed track, its 2000x2000 box scaled onto the dial'''
+    return placed('track', 0, 1.0 * self.radius / 1000,
+        self.center[0] - self.radius, self.center[1] - self.radius)
+
+  def index_placements(self):
+    '''the placed index of every position of the dial that index_rules
+    (default_index_rules if None) give a unit. The unit of each is its
+    kind.'''
+    units = index_table(self.index_rules or default_index_rules,
+        self.substeps, self.divisions, self.minute_skip)
+    table = placement_table(self.substeps, self.radius, tuple(self.center),
+        self.divisions)
+    scale = 1.0 * self.radius / 1000
+    return [placed(unit, angle, scale, matrix[4], matrix[5])
+        for unit, angle, matrix in zip(units, table.angles, table.matrices)
+        if unit]
 
-  def gen_index(self, unit, angle):
+  def placement(self, unit, angle):
+    '''unit placed on the dial rotated by angle degrees'''
+    matrix = placement_matrix(self.center, self.radius, angle)
+    return placed(unit, angle, 1.0 * self.radius / 1000, matrix[4], matrix[5])
+
+  def gen_index(self, unit, angle, kind=None):
     '''
     draw a single index on the dial. (500,0) is the edge of the dial at the
     center of the angle. (500, 1000) is the center of the dial.
     '''
     if not unit:
       return
-    unit = self.dwg.use(unit)
-    unit.translate(
+    self.emit(self.use_element(unit, self.placement(kind, angle)), kind)
+
+  def use_element(self, unit, p):
+    '''the svg use of the element unit at the placed p'''
+    use = self.dwg.use(unit)
+    if self.precision is not None:
+      self.set_matrix(use, p.matrix())
+      return use
+    if p.unit == 'track':
+      use.translate(
+          self.center[0] - self.radius,
+          self.center[1] - self.radius
+          )
+      use.scale(p.scale)
+      return use
+    use.translate(
         self.center[0] - self.radius/2,
         self.center[1] - self.radius
         )
-    unit.rotate(angle, (self.radius/2,self.radius))
+    use.rotate(p.angle, (self.radius/2,self.radius))
     # if vertical is set, need to do an additional rotation here
-    unit.scale(1.0 * self.radius / 1000)
-    self.dwg.add(unit)
+    use.scale(p.scale)
+    return use
 
   def define_hands(self):
-    for hand_name in ['hourhand', 'minhand', 'sechand']:
+    for hand_name in hand_names:
       self.add_name_to_drawing_defs(hand_name)
 
   def gen_hands(self):
-    hand_angles = time_to_hand_angles(self.dtime)
-    self.gen_hand(self.hourhand, hand_angles[0])
-    self.gen_hand(self.minhand, hand_angles[1])
-    self.gen_hand(self.sechand, hand_angles[2])
+    for name, hand in self.hand_parts():
+      self.emit(hand, 'hand')
+
+  def hand_parts(self, names=hand_names):
+    '''(name, element) of the hands in names as gen_hands draws them, at
+    dtime and running if animate is set'''
+    refs = self.refs()
+    angles = self.hand_angles(self.dtime)
+    parts = []
+    for name in names:
+      if not refs[name]:
+        continue
+      angle = angles[name]
+      if self.animate:
+        parts.append((name, self.animated_hand(name, refs[name], angle)))
+      else:
+        parts.append((name, self.hand_element(refs[name], angle)))
+    return parts
+
+  def animated_hand(self, name, hand, angle):
+    '''
+    the hand at angle, kept running with an animateTransform rotation. The
+    hour, minute, gmt and day hands turn continuously, the second hand and
+    a started chronograph hand either tick once a second (animate='tick')
+    or sweep with substeps beats per second (animate='sweep').
+    '''
+    if name == 'chronohand' and self.chrono_start is None:
+      return self.hand_element(hand, angle)
+    period = {'hourhand':12 * 60 * 60, 'minhand':60 * 60, 'sechand':60,
+        'gmthand':24 * 60 * 60, 'dayhand':7 * 24 * 60 * 60,
+        'chronohand':60}[name]
+    steps = None
+    if name in ('sechand', 'chronohand'):
+      steps = 60
+      if self.animate == 'sweep':
+        steps = 60 * self.substeps
+    begin = 0
+    if steps:
+      # start on the last step and catch up with the rest of the step
+      phase = angle % (360.0 / steps)
+      angle -= phase
+      begin = -period * phase / 360.0
+    hand = self.hand_element(hand, angle)
+    hand.add(self.hand_rotation(period, steps, begin))
+    return hand
+
+  def hand_rotation(self, period, steps=None, begin=0):
+    '''
+    a full turn of a hand every period seconds, relative to the transform of
+    the hand. Turns in steps discrete steps if steps is set.
+    '''
+    rotation = self.dwg.animateTransform('rotate',
+        additive='sum', dur='%ss' % period, repeatCount='indefinite')
+    if steps:
+      rotation.set_value(
+          ['%s 500 1000' % (360.0 * i / steps) for i in range(steps)],
+          calcMode='discrete')
+      rotation['begin'] = '%ss' % round(begin, 6)
+    else:
+      rotation.set_value(None, from_='0 500 1000', to='360 500 1000')
+    return rotation
+
+  def hand_elements(self, dtime):
+    '''returns the hand elements for dtime without adding them to the
+    drawing'''
+    refs = self.refs()
+    return [self.use_element(refs[p.unit], p)
+        for p in self.hand_placements(dtime) if refs[p.unit]]
+
+  def hand_placements(self, dtime):
+    '''the placed hands at dtime. Hands point down in their box, so they
+    are turned by another 180 degrees.'''
+    angles = self.hand_angles(dtime)
+    return [self.placement(name, angles[name] + 180) for name in hand_names]
+
+  def hand_angles(self, dtime):
+    '''the angle of every hand at dtime, by hand name'''
+    angles = hand_angles([dtime], hand_names, self.gmt_offset,
+        self.chrono_start)
+    return dict([(name, angles[name][0]) for name in hand_names])
 
   def gen_hand(self, hand, angle):
+    hand = self.hand_element(hand, angle)
+    if hand is not None:
+      self.emit(hand, 'hand')
+
+  def hand_element(self, hand, angle):
     if not hand:
-      return
-    hand = self.dwg.use(hand)
-    hand.translate(
-        self.center[0] - self.radius/2,
-        self.center[1] - self.radius
-        )
-    hand.rotate(angle+180, (self.radius/2, self.radius))
-    hand.scale(1.0 * self.radius / 1000)
-    self.dwg.add(hand)
+      return None
+    return self.use_element(hand, self.placement('hand', angle + 180))
+
+  def rasterize(self, width, height, supersample=4):
+    '''
+    renders the dial at dtime straight into a (height, width, 4) numpy RGBA
+    array, without serializing the svg. Needs numpy, see raster.py, which
+    also has write_png for the result.
+    '''
+    import raster
+    return raster.render_dial(self, width, height, supersample)
+
+  def set_matrix(self, element, matrix):
+    '''
+    sets the transform of element to a single matrix. The translation is
+    formatted with self.precision decimals, the rotation and scale get three
+    more as they are multiplied with unit coordinates of up to 1000.
+    '''
+    fmt = number_formatter(self.precision + 3)
+    parts = [fmt(v) for v in matrix[:4]]
+    fmt = number_formatter(self.precision)
+    parts.extend([fmt(v) for v in matrix[4:]])
+    element['transform'] = 'matrix(%s)' % ' '.join(parts)
 
   def add_name_to_drawing_defs(self, name, override=None):
-    element = self.__dict__.get(name)
-    if not element:
-      element = self.__dict__.get(override)
-    if not element:
-      self.__dict__[name] = None
-      return
-    self.__dict__[name] = self.dwg.defs.add(self.dwg.g(id=name))
-    self.__dict__[name].add(element)
+    '''adds the group of unit name to the defs of the drawing, in place of
+    the one added before. Groups other dials on the drawing already added
+    are only referenced.'''
+    group, freed = self.define_group(name, override)
+    defs = self.dwg.defs.elements
+    present = group is None or _contains(defs, group)
+    for i, element in enumerate(defs):
+      if freed is not None and element is freed:
+        if present:
+          del defs[i]
+        else:
+          defs[i] = group
+        return
+    if not present:
+      # next to the groups of the other units, in document order
+      names = ['track'] + index_names + hand_names
+      index = names.index(name)
+      before = [self._groups.get(n) for n in names[:index]]
+      after = [self._groups.get(n) for n in names[index + 1:]]
+      before = [g for g in before if g is not None and _contains(defs, g)]
+      after = [g for g in after if g is not None and _contains(defs, g)]
+      position = len(defs)
+      if before:
+        position = _index_of(defs, before[-1]) + 1
+      elif after:
+        position = _index_of(defs, after[0])
+      defs.insert(position, group)
+
+  def define_group(self, name, override=None):
+    '''
+    takes the group of unit name from the defs_registry of the drawing, see
+    unit_element. Returns (group, freed): freed is the group used before if
+    no dial uses it any more, else None.
+    '''
+    registry = drawing_registry(self.dwg)
+    owner = (id(self), name)
+    old, freed = self._groups.get(name), None
+    if old is not None and registry.release(old, owner):
+      freed = old
+    element = self.unit_element(name, override)
+    group = None
+    if element:
+      group = registry.acquire(name, element, owner)
+    self._groups[name] = group
+    return group, freed
+
+  def unit_element(self, name, override=None):
+    '''the unit name, or the group of override if there is no unit. None if
+    there is neither, or if the unit is an index that is baked.'''
+    if self.bake and name in index_names:
+      return None
+    element = getattr(self, name)
+    if not element and override:
+      element = self._groups.get(override)
+    return element or None
+
+  def add_to_drawing(self):
+    '''
+    adds the defs and elements of the dial to its drawing without saving
+    it, to put several dials on one drawing. Units that are the same on
+    several dials are defined once, see defs_registry.
+    '''
+    self.update_defs(['track'] + index_names + hand_names)
+    self.update_part('track', self.track_parts)
+    self.update_part('indices', self.index_parts)
+    self.update_hands()
+
+class dial_stats:
+  '''
+  what a gen_dial with instrument set did: the wall time and tracemalloc
+  peak of every stage, the number of emitted elements by kind (top, major,
+  hour, minute, sub, track and hand) and the bytes written. instrument is
+  True, or a callback or list of callbacks that are called with the stats
+  and the stage name after every stage and with 'done' at the end. 'time'
+  leaves out the peaks, tracemalloc slows the stages down.
+  '''
+  def __init__(self, instrument=True):
+    self.stages = collections.OrderedDict()
+    self.elements = collections.Counter()
+    self.bytes_written = 0
+    if callable(instrument):
+      self.callbacks = [instrument]
+    elif isinstance(instrument, (list, tuple)):
+      self.callbacks = list(instrument)
+    else:
+      self.callbacks = []
+    self.memory = instrument != 'time'
+    self.started_tracing = False
+    if self.memory:
+      import tracemalloc
+      self.started_tracing = not tracemalloc.is_tracing()
+      if self.started_tracing:
+        tracemalloc.start()
+
+  def run_stage(self, name, step):
+    if not self.memory:
+      start = time.perf_counter()
+      step()
+      seconds, peak = time.perf_counter() - start, None
+    else:
+      import tracemalloc
+      tracemalloc.reset_peak()
+      base = tracemalloc.get_traced_memory()[0]
+      start = time.perf_counter()
+      step()
+      seconds = time.perf_counter() - start
+      peak = tracemalloc.get_traced_memory()[1] - base
+    self.stages[name] = {'seconds':seconds, 'peak_bytes':peak}
+    for callback in self.callbacks:
+      callback(self, name)
+
+  def stop(self):
+    '''stops tracemalloc if the stats started it'''
+    if self.started_tracing:
+      import tracemalloc
+      tracemalloc.stop()
+      self.started_tracing = False
+
+  def finish(self):
+    self.stop()
+    for callback in self.callbacks:
+      callback(self, 'done')
+    return self
+
+  def total_seconds(self):
+    return sum([stage['seconds'] for stage in self.stages.values()])
+
+  def __repr__(self):
+    return '<dial_stats %.4fs %d elements %d bytes>' % (
+        self.total_seconds(), sum(self.elements.values()), self.bytes_written)
+
+class counting_writer(object):
+  '''a binary file-like object that writes to stream and adds the bytes
+  to stats.bytes_written, after compression if it is the file object of a
+  GzipFile'''
+  def __init__(self, stream, stats):
+    self.stream = stream
+    self.stats = stats
+
+  def write(self, data):
+    self.stream.write(data)
+    self.stats.bytes_written += len(data)
+    return len(data)
+
+  def flush(self):
+    if hasattr(self.stream, 'flush'):
+      self.stream.flush()
+
+def clock_times(step=60, span=12 * 3600):
+  '''the times from midnight every step seconds for span seconds, by
+  default the 720 minute positions of the hands of a 12 hour dial'''
+  return [(datetime.datetime.min + datetime.timedelta(seconds=s)).time()
+      for s in range(0, span, step)]
 
 def time_to_hand_angles(in_time, full_circle=360.0):
   '''returns a triple of degrees, indicating the angle from 0 of the hour,
@@ -252,12 +1157,793 @@ def time_to_hand_angles(in_time, full_circle=360.0):
   hour_angle = (hour / 12.0) * full_circle + (min_angle / 12.0)
   return (hour_angle, min_angle, sec_angle)
 
+def hand_angles(times, names=None, gmt_offset=0, chrono_start=None,
+    full_circle=360.0):
+  '''
+  the angles of the hands names (default hand_names) at all of times in
+  one pass, as a dict of hand name to a list of degrees, or to a numpy
+  array for numpy and big batches of times. times holds datetime.time or
+  datetime.datetime, numpy datetime64 or float seconds since 1970-01-01.
+    hourhand, minhand, sechand: as time_to_hand_angles
+    gmthand: one turn in 24 hours, gmt_offset hours ahead of the time
+    dayhand: one turn a week from monday 0:00, datetime.time is a monday
+    chronohand: the seconds of a chronograph started at chrono_start, a
+      datetime.time or seconds since midnight. 0 while it is None.
+  '''
+  if names is None:
+    names = hand_names
+  if chrono_start is not None and not isinstance(chrono_start, (int, float)):
+    chrono_start = _clock_components(chrono_start)
+    chrono_start = (chrono_start[0] * 3600 + chrono_start[1] * 60
+        + chrono_start[2] + chrono_start[3] / 1000000.0)
+  numpy = None
+  if hasattr(times, 'dtype') or (len(times)
+      and not isinstance(times[0], (datetime.time, datetime.datetime))):
+    numpy = _numpy(len(times))
+  if numpy is None:
+    angles = dict([(name, []) for name in names])
+    for t in times:
+      for name, angle in _hand_angles(_clock_components(t), names,
+          gmt_offset, chrono_start, full_circle).items():
+        angles[name].append(angle)
+    return angles
+  times = numpy.asarray(times)
+  if times.dtype.kind == 'M':
+    usecs = times.astype('datetime64[us]').astype(numpy.int64)
+  else:
+    usecs = numpy.round(times.astype(float) * 1000000).astype(numpy.int64)
+  return _hand_angles(_usec_components(usecs), names, gmt_offset,
+      chrono_start, full_circle)
+
+def _clock_components(t):
+  '''(hour, minute, second, microsecond, weekday) of a time'''
+  if isinstance(t, datetime.datetime):
+    return t.hour, t.minute, t.second, t.microsecond, t.weekday()
+  if isinstance(t, datetime.time):
+    return t.hour, t.minute, t.second, t.microsecond, 0
+  return _usec_components(int(round(t * 1000000)))
+
+def _usec_components(usecs):
+  '''(hour, minute, second, microsecond, weekday) of microseconds since
+  1970-01-01, a thursday. Works on numbers and numpy arrays alike.'''
+  days, usecs = usecs // 86400000000, usecs % 86400000000
+  seconds, usec = usecs // 1000000, usecs % 1000000
+  return (seconds // 3600, seconds // 60 % 60, seconds % 60, usec,
+      (days + 3) % 7)
+
+def _hand_angles(components, names, gmt_offset, chrono_start, full_circle):
+  '''the angles of the hands names from the components of times, as
+  numbers or numpy arrays'''
+  hour, min, sec, usec, weekday = components
+  usec_angle = (usec / (60.0 * 1000000)) * full_circle
+  sec_angle = (sec / 60.0) * full_circle + usec_angle
+  min_angle = (min / 60.0) * full_circle + (sec_angle / 60.0)
+  angles = {
+      'hourhand':(hour / 12.0) * full_circle + (min_angle / 12.0),
+      'minhand':min_angle,
+      'sechand':sec_angle,
+      }
+  if 'gmthand' in names:
+    angles['gmthand'] = (((hour + gmt_offset) % 24 / 24.0) * full_circle
+        + min_angle / 24.0)
+  if 'dayhand' in names:
+    angles['dayhand'] = ((weekday / 7.0) * full_circle
+        + ((hour / 24.0) * full_circle + min_angle / 24.0) / 7.0)
+  if 'chronohand' in names:
+    if chrono_start is None:
+      angles['chronohand'] = sec_angle * 0
+    else:
+      elapsed = hour * 3600 + min * 60 + sec + usec / 1000000.0 - chrono_start
+      angles['chronohand'] = (elapsed % 60 / 60.0) * full_circle
+  return dict([(name, angles[name]) for name in names])
+
+placement = collections.namedtuple('placement', ['angles', 'matrices'])
+
+@functools.lru_cache(maxsize=64)
+def placement_table(substeps, radius, center, divisions=60):
+  '''
+  computes the placement of all divisions * substeps index positions in one
+  batch. Returns a placement of tuples: the angle of every position and the
+  svg matrix(a,b,c,d,e,f) that places an index unit at that position.
+  Tables are memoized and shared between dials, center has to be a tuple.
+  '''
+  step = 360.0 / divisions
+  numpy = _numpy(divisions * substeps)
+  if numpy is None:
+    return _placement_table_py(substeps, radius, center, divisions)
+  i = numpy.arange(divisions * substeps)
+  angles = step * i / substeps
+  scale = 1.0 * radius / 1000
+  rad = numpy.radians(angles)
+  cos = scale * numpy.cos(rad)
+  sin = scale * numpy.sin(rad)
+  matrices = numpy.column_stack((cos, sin, -sin, cos,
+      center[0] - (500 * cos - 1000 * sin),
+      center[1] - (500 * sin + 1000 * cos)))
+  return placement(tuple(angles.tolist()),
+      tuple(map(tuple, matrices.tolist())))
+
+def _numpy(size):
+  '''
+  numpy for a batch of size, or None. Importing numpy costs more than a
+  small table, so it is only imported for big tables, or used if someone
+  else imported it already.
+  '''
+  if 'numpy' not in sys.modules and size < 2400:
+    return None
+  try:
+    import numpy
+  except ImportError:
+    return None
+  return numpy
+
+def _placement_table_py(substeps, radius, center, divisions=60):
+  '''pure python fallback for placement_table if numpy is not installed'''
+  step = 360.0 / divisions
+  angles = [step * i / substeps for i in range(divisions * substeps)]
+  return placement(tuple(angles),
+      tuple([placement_matrix(center, radius, angle) for angle in angles]))
+
+index_rule_keys = ('unit', 'every', 'at', 'between')
+
+def index_table(rules, substeps, divisions=60, minute_skip=None):
+  '''
+  the unit of each of the divisions * substeps index positions, None where
+  there is none. rules is a list of dicts, later rules override earlier
+  ones. A rule sets 'unit' (an index name, or None to leave positions
+  empty) at
+    'every': every so many divisions,
+    'at': a division or a list of them, fractions on a substep for
+    positions in between,
+  or at every position if it has neither. 'between': (first, last)
+  limits a rule to the divisions first to last, wrapping past 0 if first
+  is larger. The minutes in minute_skip lose their minute units.
+
+  The default dial is default_index_rules with 60 divisions. Tables are
+  compiled once per rule set and shared between dials.
+  '''
+  key = []
+  for rule in rules:
+    unknown = set(rule) - set(index_rule_keys)
+    if unknown:
+      raise ValueError('unknown index rule keys %s' % sorted(unknown))
+    if rule.get('unit') not in index_names + [None]:
+      raise ValueError('unknown index unit %r' % (rule.get('unit'),))
+    every = rule.get('every')
+    if every is not None and int(round(every * substeps)) < 1:
+      raise ValueError('index rule every %r is less than a substep (1/%d '
+          'division)' % (every, substeps))
+    for name in ('at', 'between'):
+      values = rule.get(name)
+      if values is not None and not isinstance(values, (list, tuple)):
+        values = [values]
+      for d in values or ():
+        if abs(d * substeps - round(d * substeps)) > 1e-9:
+          raise ValueError('index rule %s %r is not on a substep (1/%d '
+              'division)' % (name, d, substeps))
+    key.append(tuple([_rule_value(rule.get(name))
+        for name in index_rule_keys]))
+  return _index_table(tuple(key), substeps, divisions,
+      tuple(sorted(minute_skip or ())))
+
+def _rule_value(value):
+  if isinstance(value, (list, tuple)):
+    return tuple(value)
+  return value
+
+@functools.lru_cache(maxsize=64)
+def _index_table(rules, substeps, divisions, minute_skip):
+  n = divisions * substeps
+  table = [None] * n
+  for unit, every, at, between in rules:
+    if every is not None:
+      positions = range(0, n, int(round(every * substeps)))
+    elif at is not None:
+      if not isinstance(at, tuple):
+        at = (at,)
+      positions = [int(round(d * substeps)) % n for d in at]
+    else:
+      positions = range(n)
+    if between is not None:
+      first, last = [int(round(d * substeps)) % n for d in between]
+      if first <= last:
+        positions = [i for i in positions if first <= i <= last]
+      else:
+        positions = [i for i in positions if i >= first or i <= last]
+    for i in positions:
+      table[i] = unit
+  for minute in minute_skip:
+    i = minute * substeps
+    if 0 <= i < n and table[i] == 'minute':
+      table[i] = None
+  return tuple(table)
+
+@functools.lru_cache(maxsize=64)
+def ring_symmetry(sequence):
+  '''
+  the rotational symmetry of a ring of units, sequence holds the unit of
+  every position or None. Returns (period, variable): the ring repeats
+  every period positions, apart from the offsets in variable whose unit
+  is not the same in every sector. The period is the one that needs the
+  fewest elements to draw one sector, its rotated copies and the variable
+  positions, None if none needs fewer than drawing every position.
+  '''
+  n = len(sequence)
+  best, best_cost = None, len([u for u in sequence if u is not None])
+  for period in range(1, n // 2 + 1):
+    if n % period:
+      continue
+    variable = frozenset([i for i in range(period)
+        if len(set(sequence[i::period])) > 1])
+    cost = n // period
+    for i in range(period):
+      if i in variable:
+        cost += len([u for u in sequence[i::period] if u is not None])
+      elif sequence[i] is not None:
+        cost += 1
+    if cost < best_cost:
+      best, best_cost = (period, variable), cost
+  return best
+
+def placement_matrix(center, radius, angle):
+  '''
+  the svg matrix(a,b,c,d,e,f) equivalent of translating a unit to the dial,
+  rotating it by angle degrees around the center of the dial and scaling it
+  to radius.
+  '''
+  scale = 1.0 * radius / 1000
+  cos = scale * math.cos(math.radians(angle))
+  sin = scale * math.sin(math.radians(angle))
+  return (cos, sin, -sin, cos,
+      center[0] - (500 * cos - 1000 * sin),
+      center[1] - (500 * sin + 1000 * cos))
+
+@functools.lru_cache(maxsize=None)
+def number_formatter(precision):
+  '''
+  returns a function that formats a number with at most precision decimals,
+  without trailing zeros.
+  '''
+  template = '%%.%df' % precision
+  def fmt(value):
+    text = template % value
+    if '.' in text:
+      text = text.rstrip('0').rstrip('.')
+    if text == '-0':
+      return '0'
+    return text
+  return fmt
+
+def format_path(commands, precision=None):
+  '''formats a list of path commands and coordinate tuples as a path
+  string, with at most precision decimals if precision is not None'''
+  fmt = str if precision is None else number_formatter(precision)
+  parts = []
+  for command in commands:
+    if isinstance(command, str):
+      parts.append(command)
+    else:
+      parts.extend([fmt(v) for v in command])
+  return ' '.join(parts)
+
+def command_path(commands, fmt=str):
+  '''absolute path commands (see below) as svg path data'''
+  parts = []
+  for command in commands:
+    parts.append(command[0])
+    parts.extend([fmt(v) for v in command[1:]])
+  return ' '.join(parts)
+
+# geometry of svgwrite elements, for the backends that do not go through svg.
+# Matrices are svg matrix(a,b,c,d,e,f) tuples, path geometry is a list of
+# absolute commands: ('M', x, y), ('L', x, y), ('C', x1, y1, x2, y2, x, y),
+# ('Q', x1, y1, x, y), ('A', rx, ry, rotation, large_arc, sweep, x, y) and
+# ('Z',).
+
+identity = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+default_style = {
+    'fill':'black',
+    'stroke':'none',
+    'stroke-width':1,
+    'fill-rule':'nonzero',
+    }
+
+shape = collections.namedtuple('shape',
+    ['commands', 'circle', 'fill', 'stroke', 'stroke_width', 'fill_rule'])
+
+_transform_pattern = (
+    r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+_number_pattern = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_path_pattern = (
+    r'([MmZzLlHhVvCcSsQqTtAa])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_path_arity = {'m':2, 'z':0, 'l':2, 'h':1, 'v':1, 'c':6, 's':4, 'q':4,
+    't':2, 'a':7}
+
+def multiply_matrices(m, n):
+  '''the matrix that applies n first and then m'''
+  a, b, c, d, e, f = m
+  A, B, C, D, E, F = n
+  return (a * A + c * B, b * A + d * B,
+      a * C + c * D, b * C + d * D,
+      a * E + c * F + e, b * E + d * F + f)
+
+def apply_matrix(m, x, y):
+  return m[0] * x + m[2] * y + m[4], m[1] * x + m[3] * y + m[5]
+
+def is_similarity(m, eps=1e-9):
+  '''true if m only rotates, scales uniformly and translates'''
+  size = abs(m[0]) + abs(m[1]) + eps
+  return abs(m[0] - m[3]) < eps * size and abs(m[1] + m[2]) < eps * size
+
+def parse_transform(text):
+  '''the matrix of an svg transform attribute'''
+  m = identity
+  for name, args in re.findall(_transform_pattern, text or ''):
+    v = [float(x) for x in re.findall(_number_pattern, args)]
+    if name == 'matrix':
+      n = tuple(v)
+    elif name == 'translate':
+      n = (1.0, 0.0, 0.0, 1.0, v[0], v[1] if len(v) > 1 else 0.0)
+    elif name == 'scale':
+      n = (v[0], 0.0, 0.0, v[1] if len(v) > 1 else v[0], 0.0, 0.0)
+    elif name == 'rotate':
+      cos = math.cos(math.radians(v[0]))
+      sin = math.sin(math.radians(v[0]))
+      cx, cy = (v[1], v[2]) if len(v) > 2 else (0.0, 0.0)
+      n = (cos, sin, -sin, cos,
+          cx - cos * cx + sin * cy, cy - sin * cx - cos * cy)
+    elif name == 'skewX':
+      n = (1.0, 0.0, math.tan(math.radians(v[0])), 1.0, 0.0, 0.0)
+    else:
+      n = (1.0, math.tan(math.radians(v[0])), 0.0, 1.0, 0.0, 0.0)
+    m = multiply_matrices(m, n)
+  return m
+
+def parse_path(d):
+  '''svg path data as a list of absolute commands'''
+  commands = []
+  x = y = start_x = start_y = 0.0
+  control = None
+  op, args = None, []
+  for letter, number in re.findall(_path_pattern, d):
+    if letter:
+      op, args = letter, []
+      if op in 'Zz':
+        commands.append(('Z',))
+        x, y = start_x, start_y
+      continue
+    args.append(float(number))
+    if op is None or len(args) < _path_arity[op.lower()]:
+      continue
+    rel = op.islower()
+    dx, dy = (x, y) if rel else (0.0, 0.0)
+    upper = op.upper()
+    if upper == 'M':
+      x, y = args[0] + dx, args[1] + dy
+      start_x, start_y = x, y
+      commands.append(('M', x, y))
+      op = 'l' if rel else 'L'
+    elif upper in 'LHV':
+      if upper == 'L':
+        x, y = args[0] + dx, args[1] + dy
+      elif upper == 'H':
+        x = args[0] + dx
+      else:
+        y = args[0] + dy
+      commands.append(('L', x, y))
+    elif upper in 'CS':
+      if upper == 'C':
+        x1, y1 = args[0] + dx, args[1] + dy
+        args = args[2:]
+      elif commands and commands[-1][0] == 'C':
+        x1, y1 = 2 * x - commands[-1][3], 2 * y - commands[-1][4]
+      else:
+        x1, y1 = x, y
+      x2, y2 = args[0] + dx, args[1] + dy
+      x, y = args[2] + dx, args[3] + dy
+      commands.append(('C', x1, y1, x2, y2, x, y))
+    elif upper in 'QT':
+      if upper == 'Q':
+        control = (args[0] + dx, args[1] + dy)
+        args = args[2:]
+      elif commands and commands[-1][0] == 'Q':
+        control = (2 * x - control[0], 2 * y - control[1])
+      else:
+        control = (x, y)
+      x, y = args[0] + dx, args[1] + dy
+      commands.append(('Q', control[0], control[1], x, y))
+    else:
+      x, y = args[5] + dx, args[6] + dy
+      commands.append(('A', abs(args[0]), abs(args[1]), args[2],
+          int(args[3] != 0), int(args[4] != 0), x, y))
+    args = []
+  return commands
+
+def arc_center(x1, y1, rx, ry, rotation, large_arc, sweep, x2, y2):
+  '''
+  the center parametrisation of an svg arc starting at x1, y1 as
+  (cx, cy, rx, ry, phi, theta, dtheta), angles in radians. Returns None if
+  the arc is a straight line.
+  '''
+  if rx == 0 or ry == 0 or (x1 == x2 and y1 == y2):
+    return None
+  phi = math.radians(rotation)
+  cos, sin = math.cos(phi), math.sin(phi)
+  hx, hy = (x1 - x2) / 2.0, (y1 - y2) / 2.0
+  px = cos * hx + sin * hy
+  py = -sin * hx + cos * hy
+  grow = (px * px) / (rx * rx) + (py * py) / (ry * ry)
+  if grow > 1:
+    rx, ry = rx * math.sqrt(grow), ry * math.sqrt(grow)
+  num = rx * rx * ry * ry - rx * rx * py * py - ry * ry * px * px
+  den = rx * rx * py * py + ry * ry * px * px
+  root = math.sqrt(max(0.0, num / den))
+  if large_arc == sweep:
+    root = -root
+  qx, qy = root * rx * py / ry, -root * ry * px / rx
+  cx = cos * qx - sin * qy + (x1 + x2) / 2.0
+  cy = sin * qx + cos * qy + (y1 + y2) / 2.0
+  theta = math.atan2((py - qy) / ry, (px - qx) / rx)
+  dtheta = math.atan2((-py - qy) / ry, (-px - qx) / rx) - theta
+  if sweep and dtheta < 0:
+    dtheta += 2 * math.pi
+  elif not sweep and dtheta > 0:
+    dtheta -= 2 * math.pi
+  return cx, cy, rx, ry, phi, theta, dtheta
+
+def arc_point(center, t):
+  '''the point at angle t of an arc_center parametrisation'''
+  cx, cy, rx, ry, phi = center[:5]
+  ex, ey = rx * math.cos(t), ry * math.sin(t)
+  return (cx + math.cos(phi) * ex - math.sin(phi) * ey,
+      cy + math.sin(phi) * ex + math.cos(phi) * ey)
+
+def arc_to_curves(x1, y1, arc):
+  '''an ('A', ...) command starting at x1, y1 as a list of 'C' commands of
+  at most a quarter turn each'''
+  center = arc_center(x1, y1, *arc[1:])
+  if center is None:
+    return [('L', arc[6], arc[7])]
+  cx, cy, rx, ry, phi, theta, dtheta = center
+  cos, sin = math.cos(phi), math.sin(phi)
+  n = int(math.ceil(abs(dtheta) / (math.pi / 2) - 1e-9)) or 1
+  step = dtheta / n
+  k = 4.0 / 3 * math.tan(step / 4)
+  curves = []
+  for i in range(n):
+    t1, t2 = theta + i * step, theta + (i + 1) * step
+    ax, ay = arc_point(center, t1)
+    bx, by = arc_point(center, t2)
+    tax = -rx * math.sin(t1) * cos - ry * math.cos(t1) * sin
+    tay = -rx * math.sin(t1) * sin + ry * math.cos(t1) * cos
+    tbx = -rx * math.sin(t2) * cos - ry * math.cos(t2) * sin
+    tby = -rx * math.sin(t2) * sin + ry * math.cos(t2) * cos
+    curves.append(('C', ax + k * tax, ay + k * tay,
+        bx - k * tbx, by - k * tby, bx, by))
+  # end exactly where the arc ends
+  curves[-1] = curves[-1][:5] + (arc[6], arc[7])
+  return curves
+
+def _transform_points(m, command):
+  values = []
+  for i in range(1, len(command), 2):
+    values.extend(apply_matrix(m, command[i], command[i + 1]))
+  return (command[0],) + tuple(values)
+
+def transform_commands(commands, m):
+  '''applies matrix m to a list of absolute path commands. Arcs stay arcs
+  under similarity transforms and are turned into curves otherwise.'''
+  similar = is_similarity(m)
+  scale = math.hypot(m[0], m[1])
+  rotation = math.degrees(math.atan2(m[1], m[0]))
+  out = []
+  x = y = start_x = start_y = 0.0
+  for command in commands:
+    op = command[0]
+    if op == 'A' and similar:
+      out.append(('A', command[1] * scale, command[2] * scale,
+          command[3] + rotation, command[4], command[5])
+          + apply_matrix(m, command[6], command[7]))
+    elif op == 'A':
+      out.extend([_transform_points(m, curve)
+          for curve in arc_to_curves(x, y, command)])
+    elif op == 'Z':
+      out.append(command)
+    else:
+      out.append(_transform_points(m, command))
+    if op == 'M':
+      start_x, start_y = command[1], command[2]
+    if op == 'Z':
+      x, y = start_x, start_y
+    else:
+      x, y = command[-2], command[-1]
+  return out
+
+def transform_shape(s, m):
+  '''applies matrix m to a shape'''
+  circle = None
+  if s.circle is not None and is_similarity(m):
+    cx, cy = apply_matrix(m, s.circle[0], s.circle[1])
+    circle = (cx, cy, s.circle[2] * math.hypot(m[0], m[1]))
+  scale = math.sqrt(abs(m[0] * m[3] - m[1] * m[2]))
+  return s._replace(commands=transform_commands(s.commands, m),
+      circle=circle, stroke_width=s.stroke_width * scale)
+
+def _length(value, default=0.0):
+  '''a number from an svg attribute, units are ignored'''
+  if value is None:
+    return default
+  try:
+    return float(value)
+  except ValueError:
+    return float(re.match(_number_pattern, str(value)).group(0))
+
+def element_commands(element):
+  '''the outline of a single svgwrite shape element as absolute path
+  commands, and (cx, cy, r) for circles'''
+  a = element.attribs
+  name = element.elementname
+  if name == 'path':
+    return parse_path(' '.join([str(v)
+        for v in _flatten(element.commands) if v is not None])), None
+  if name == 'rect':
+    x, y = _length(a.get('x')), _length(a.get('y'))
+    w, h = _length(a.get('width')), _length(a.get('height'))
+    rx, ry = a.get('rx'), a.get('ry')
+    rx, ry = _length(ry if rx is None else rx), _length(rx if ry is None else ry)
+    rx, ry = min(rx, w / 2), min(ry, h / 2)
+    if rx <= 0 or ry <= 0:
+      return [('M', x, y), ('L', x + w, y), ('L', x + w, y + h),
+          ('L', x, y + h), ('Z',)], None
+    return [('M', x + rx, y), ('L', x + w - rx, y),
+        ('A', rx, ry, 0, 0, 1, x + w, y + ry), ('L', x + w, y + h - ry),
+        ('A', rx, ry, 0, 0, 1, x + w - rx, y + h), ('L', x + rx, y + h),
+        ('A', rx, ry, 0, 0, 1, x, y + h - ry), ('L', x, y + ry),
+        ('A', rx, ry, 0, 0, 1, x + rx, y), ('Z',)], None
+  if name in ('circle', 'ellipse'):
+    cx, cy = _length(a.get('cx')), _length(a.get('cy'))
+    if name == 'circle':
+      rx = ry = _length(a.get('r'))
+    else:
+      rx, ry = _length(a.get('rx')), _length(a.get('ry'))
+    circle = (cx, cy, rx) if name == 'circle' else None
+    return [('M', cx + rx, cy), ('A', rx, ry, 0, 0, 1, cx - rx, cy),
+        ('A', rx, ry, 0, 0, 1, cx + rx, cy), ('Z',)], circle
+  if name == 'line':
+    return [('M', _length(a.get('x1')), _length(a.get('y1'))),
+        ('L', _length(a.get('x2')), _length(a.get('y2')))], None
+  if name in ('polyline', 'polygon') and element.points:
+    points = [(float(x), float(y)) for x, y in element.points]
+    commands = [('M',) + points[0]] + [('L',) + p for p in points[1:]]
+    if name == 'polygon':
+      commands.append(('Z',))
+    return commands, None
+  return [], None
+
+def _flatten(values):
+  for value in values:
+    if isinstance(value, (list, tuple)):
+      for item in _flatten(value):
+        yield item
+    else:
+      yield value
+
+def drawing_style(dwg):
+  '''the presentation attributes a drawing passes on to its elements'''
+  return element_style(dwg, default_style)
+
+def element_style(element, style):
+  '''style updated with the presentation attributes set on element'''
+  style = dict(style)
+  for key in default_style:
+    if element.attribs.get(key) is not None:
+      style[key] = element.attribs[key]
+  return style
+
+def element_shapes(element, matrix=identity, style=default_style):
+  '''
+  the geometry of an svgwrite element and its children as a list of shapes,
+  transformed by matrix. Groups, use references to element objects and the
+  basic shapes are supported, style holds the inherited presentation
+  attributes.
+  '''
+  style = element_style(element, style)
+  matrix = multiply_matrices(matrix,
+      parse_transform(element.attribs.get('transform')))
+  name = element.elementname
+  if name in ('g', 'svg', 'symbol'):
+    shapes = []
+    for child in element.elements:
+      if child.elementname != 'defs':
+        shapes.extend(element_shapes(child, matrix, style))
+    return shapes
+  if name == 'use':
+    if not hasattr(element.href, 'elementname'):
+      return []
+    matrix = multiply_matrices(matrix, (1.0, 0.0, 0.0, 1.0,
+        _length(element.attribs.get('x')), _length(element.attribs.get('y'))))
+    return element_shapes(element.href, matrix, style)
+  commands, circle = element_commands(element)
+  if not commands:
+    return []
+  s = shape(commands, circle, style['fill'], style['stroke'],
+      _length(style['stroke-width'], 1.0), style['fill-rule'])
+  return [transform_shape(s, matrix)]
+
+def split_drawing(dwg, elements=()):
+  '''
+  serializes dwg and splits it at the end of its defs and where the run of
+  its elements in elements is, left out, or in front of the closing svg
+  tag, so that defs and elements can be spliced into the serialized
+  document. Returns three utf-8 encoded byte strings.
+  '''
+  defs_mark = dwg.g(id='dial-defs-mark')
+  body_mark = dwg.g(id='dial-body-mark')
+  skip = set(map(id, elements))
+  body = dwg.elements[:]
+  kept = [element for element in body if id(element) not in skip]
+  position = len(kept)
+  for i, element in enumerate(body):
+    if id(element) in skip:
+      position = i
+      break
+  kept.insert(position, body_mark)
+  dwg.defs.add(defs_mark)
+  dwg.elements[:] = kept
+  try:
+    buf = io.StringIO()
+    dwg.write(buf)
+  finally:
+    dwg.defs.elements.remove(defs_mark)
+    dwg.elements[:] = body
+  doc = buf.getvalue().encode('utf-8')
+  prefix, rest = doc.split(defs_mark.tostring().encode('utf-8'))
+  middle, tail = rest.split(body_mark.tostring().encode('utf-8'))
+  return prefix, middle, tail
+
+def _contains(elements, element):
+  '''true if element is in elements, by identity'''
+  return any([e is element for e in elements])
+
+def _index_of(elements, element):
+  '''the position of element in elements, by identity'''
+  for i, e in enumerate(elements):
+    if e is element:
+      return i
+  raise ValueError('element not in the drawing')
+
+# parameters of a mission-timer.py style dial. The outer radii default to
+# min_or, hour_h to min_h and major_h, top_h to 2.5 * min_h.
+sweep_defaults = {
+    'size':(2400, 2400),
+    'center':(1200, 1200),
+    'radius':1000,
+    'min_or':975.0,
+    'min_h':150.0,
+    'min_w':8.0,
+    'hour_or':None,
+    'hour_h':None,
+    'hour_angle':quarter_minute,
+    'major_or':None,
+    'major_h':None,
+    'major_angle':quarter_minute,
+    'top_or':None,
+    'top_gap':7.0,
+    'top_h':None,
+    'top_angle':one_minute,
+    'flat_base':False,
+    'minute_skip':[1, 59],
+    'substeps':4,
+    'precision':None,
+    }
+
+def build_mission_timer(drawing, config):
+  '''builds a mission-timer.py style dial on drawing from a dict with the
+  keys of sweep_defaults'''
+  c = dict(sweep_defaults)
+  c.update(config)
+  for name in ['hour_or', 'major_or', 'top_or']:
+    if c[name] is None:
+      c[name] = c['min_or']
+  if c['hour_h'] is None:
+    c['hour_h'] = c['min_h']
+  for name in ['major_h', 'top_h']:
+    if c[name] is None:
+      c[name] = 2.5 * c['min_h']
+
+  top_dx = drawing.g()
+  draw_split_tapered_index(drawing, top_dx, c['top_or'], c['top_gap'],
+      c['top_h'], c['top_angle'], c['flat_base'], c['precision'])
+
+  hour_dx = drawing.g()
+  draw_tapered_index(drawing, hour_dx, c['hour_or'], c['hour_h'],
+      c['hour_angle'], c['flat_base'], c['precision'])
+
+  major_dx = drawing.g()
+  draw_tapered_index(drawing, major_dx, c['major_or'], c['major_h'],
+      c['major_angle'], c['flat_base'], c['precision'])
+
+  minute_dx = drawing.rect((500 - c['min_w'] / 2, 1000 - c['min_or']),
+      (c['min_w'], c['min_h']))
+
+  track = drawing.g()
+  track.add(drawing.rect((800,999),(400,2)))
+  track.add(drawing.rect((999,800),(2,400)))
+  track.add(drawing.circle((1000,1000),10))
+  track.add(drawing.circle((1000,1000),1000,stroke_width=1, stroke='black', fill='none'))
+
+  return dial(drawing, c['center'], c['radius'],
+      track=track,
+      sub=None,
+      minute_skip=c['minute_skip'],
+      top=top_dx,
+      hour=hour_dx,
+      major=major_dx,
+      minute=minute_dx,
+      sechand=None,
+      minhand=None,
+      hourhand=None,
+      substeps=c['substeps'],
+      precision=c['precision'])
+
+def _sweep_variant(job):
+  '''renders a single sweep variant, runs in the worker processes'''
+  import svgwrite
+  path, params, config = job
+  start = time.time()
+  drawing = svgwrite.Drawing(path, size=config['size'],
+      profile='full', fill='black', stroke='none')
+  build_mission_timer(drawing, config).gen_dial()
+  return {
+      'path':path,
+      'params':params,
+      'seconds':time.time() - start,
+      'bytes':os.path.getsize(path),
+      }
+
+def sweep(base_config, grid, out_dir, workers=None):
+  '''
+  renders a mission-timer.py style dial for every combination of the
+  parameter values in grid, a dict of parameter name to a list of values,
+  on top of base_config (see sweep_defaults). The variants are spread over
+  a pool of workers processes, all cores if workers is None, and written to
+  out_dir/variant-NNNNN.svg. Returns the manifest, a list with the path,
+  parameters, render time and size of every variant, which is also written
+  to out_dir/manifest.json.
+  '''
+  if not os.path.isdir(out_dir):
+    os.makedirs(out_dir)
+  names = sorted(grid)
+  jobs = []
+  for n, values in enumerate(itertools.product(*[grid[k] for k in names])):
+    params = dict(zip(names, values))
+    config = dict(sweep_defaults)
+    config.update(base_config)
+    config.update(params)
+    jobs.append((os.path.join(out_dir, 'variant-%05d.svg' % n), params, config))
+  if workers == 1:
+    manifest = [_sweep_variant(job) for job in jobs]
+  else:
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+      manifest = pool.map(_sweep_variant, jobs)
+    finally:
+      pool.close()
+      pool.join()
+  import json
+  with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+    json.dump(manifest, f, indent=2)
+  return manifest
+
 def get_hour_minute_from_angle(angle):
   minute = math.floor(angle / 6)
   hour = math.floor(minute / 5)
   return hour, minute
 
 def main():
+  import svgwrite
   centerx, centery, radius = 1200, 1200, 1000
   drawing = svgwrite.Drawing('test.svg',
           size=(centerx*2, centery*2),
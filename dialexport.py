@@ -0,0 +1,314 @@
+import math
+
+import numpy
+
+import dial
+import raster
+
+# Author: dlee@dlee.io / enkidu on watchuseek
+# Use of these files is free under the
+# [CC BY-SA 4.0](https://creativecommons.org/licenses/by-sa/4.0/) license.
+# Enjoy!
+
+# Exports the placed geometry of a dial as DXF and G-code for engraving and
+# laser cutting. Every outline of the track and the indices becomes one
+# toolpath, in machine coordinates: millimeters (scale per drawing unit),
+# y up, the center of the dial at 0,0. The toolpaths are ordered with a
+# nearest neighbour tour improved by 2-opt to keep the rapid moves short.
+#
+#   python dialexport.py dial.dxf dial.gcode
+#   python dialexport.py --mission-timer --scale 0.015 timer.gcode
+
+class toolpath(object):
+  '''
+  one outline to cut: the layer (the unit name), the list of (x, y)
+  points and whether it is closed. A closed toolpath goes back to its
+  first point and can be entered at any of them, an open one at either
+  end. circle is (cx, cy, r) if it is a whole circle, for the DXF.
+  '''
+  __slots__ = ('layer', 'points', 'closed', 'circle')
+
+  def __init__(self, layer, points, closed, circle=None):
+    self.layer = layer
+    self.points = points
+    self.closed = closed
+    self.circle = circle
+
+  def start(self):
+    return self.points[0]
+
+  def end(self):
+    return self.points[0] if self.closed else self.points[-1]
+
+  def length(self):
+    points = self.points + self.points[:1] * self.closed
+    return sum([math.hypot(b[0] - a[0], b[1] - a[1])
+        for a, b in zip(points, points[1:])])
+
+  def entered_at(self, i):
+    '''the same toolpath starting at point i, reversed if it is open and
+    entered at its last point'''
+    if self.closed:
+      points = self.points[i:] + self.points[:i]
+    elif i:
+      points = self.points[::-1]
+    else:
+      points = self.points
+    return toolpath(self.layer, points, self.closed, self.circle)
+
+  def __repr__(self):
+    return '<toolpath %s %d points%s>' % (self.layer, len(self.points),
+        ' closed' * self.closed)
+
+def toolpaths(d, hands=False, scale=1.0, tolerance=0.01):
+  '''
+  the toolpaths of the track and indices of dial d, and of the hands at
+  dtime if hands is set, in layout order. scale is the millimeters per
+  drawing unit, curves and arcs are approximated to within tolerance mm.
+  '''
+  units = d.units()
+  style = dial.drawing_style(d.dwg)
+  cx, cy = d.center
+  paths = []
+  for p in d.layout():
+    if p.unit in dial.hand_names and not hands:
+      continue
+    for s in dial.element_shapes(units[p.unit], p.matrix(), style):
+      circle = None
+      if s.circle is not None:
+        circle = ((s.circle[0] - cx) * scale, (cy - s.circle[1]) * scale,
+            s.circle[2] * scale)
+      for points, closed in raster.flatten(s.commands, tolerance / scale):
+        points = [((x - cx) * scale, (cy - y) * scale) for x, y in points]
+        if closed and len(points) > 2 and points[-1] == points[0]:
+          points.pop()
+        paths.append(toolpath(p.unit, points, closed, circle))
+  return paths
+
+def order_toolpaths(paths, start=(0.0, 0.0), passes=10, window=None):
+  '''
+  paths reordered to shorten the rapid moves between them, starting at
+  start: a nearest neighbour tour that enters every toolpath at its
+  nearest point, improved by 2-opt moves. window limits how far apart the
+  ends of a 2-opt move can be in the tour, None tries all of them.
+  '''
+  if not paths:
+    return []
+  tour = _nearest_neighbour(paths, start)
+  return _two_opt(tour, start, passes, window)
+
+def _nearest_neighbour(paths, start):
+  points, owners, offsets = [], [], []
+  for n, path in enumerate(paths):
+    candidates = range(len(path.points))
+    if not path.closed:
+      candidates = [0, len(path.points) - 1]
+    for i in candidates:
+      points.append(path.points[i])
+      owners.append(n)
+      offsets.append(i)
+  points = numpy.array(points, dtype=float)
+  owners = numpy.array(owners)
+  first = numpy.searchsorted(owners, numpy.arange(len(paths)))
+  last = numpy.searchsorted(owners, numpy.arange(len(paths)), 'right')
+  alive = numpy.ones(len(points), dtype=bool)
+  tour = []
+  x, y = start
+  for _ in range(len(paths)):
+    distance = numpy.hypot(points[:, 0] - x, points[:, 1] - y)
+    distance[~alive] = numpy.inf
+    k = int(numpy.argmin(distance))
+    n = owners[k]
+    path = paths[n].entered_at(offsets[k])
+    tour.append(path)
+    alive[first[n]:last[n]] = False
+    x, y = path.end()
+  return tour
+
+def _two_opt(tour, start, passes, window):
+  '''
+  reverses stretches of the tour, and the direction of the open toolpaths
+  in them, while that shortens the travel. Node 0 is the fixed start, the
+  tour ends at its last toolpath.
+  '''
+  entries = numpy.array([start] + [path.start() for path in tour], dtype=float)
+  exits = numpy.array([start] + [path.end() for path in tour], dtype=float)
+  order = numpy.arange(len(tour) + 1)
+  flipped = numpy.zeros(len(tour) + 1, dtype=bool)
+  m = len(order)
+  def dist(a, b):
+    return numpy.hypot(a[..., 0] - b[..., 0], a[..., 1] - b[..., 1])
+  for _ in range(passes):
+    improved = False
+    for i in range(m - 2):
+      stop = m if window is None else min(m, i + 2 + window)
+      # reversing order[i + 1:j + 1] replaces the moves i -> i + 1 and
+      # j -> j + 1 by i -> j and i + 1 -> j + 1
+      j = numpy.arange(i + 1, stop)
+      after = numpy.minimum(j + 1, m - 1)
+      closing = j + 1 < m
+      delta = (dist(exits[i], exits[j]) - dist(exits[i], entries[i + 1])
+          + closing * (dist(entries[i + 1], entries[after])
+          - dist(exits[j], entries[after])))
+      best = int(numpy.argmin(delta))
+      if delta[best] < -1e-9:
+        j = i + 1 + best
+        segment = slice(i + 1, j + 1)
+        entries[segment], exits[segment] = (exits[segment][::-1].copy(),
+            entries[segment][::-1].copy())
+        order[segment] = order[segment][::-1].copy()
+        flipped[segment] = ~flipped[segment][::-1]
+        improved = True
+    if not improved:
+      break
+  ordered = []
+  for n, flip in zip(order[1:], flipped[1:]):
+    path = tour[n - 1]
+    if flip and not path.closed:
+      path = path.entered_at(len(path.points) - 1)
+    ordered.append(path)
+  return ordered
+
+def machine_time(paths, feed=600.0, rapid=3000.0, pierce=0.0,
+    start=(0.0, 0.0)):
+  '''
+  estimated machine time of cutting paths in their order, as a dict of
+  the cut and travel millimeters and the cut, travel, pierce and total
+  seconds. feed and rapid are in mm/min, pierce is the seconds spent
+  starting each toolpath (a plunge or laser pierce).
+  '''
+  cut = sum([path.length() for path in paths])
+  travel = 0.0
+  x, y = start
+  for path in paths:
+    travel += math.hypot(path.start()[0] - x, path.start()[1] - y)
+    x, y = path.end()
+  estimate = {
+      'toolpaths':len(paths),
+      'cut_mm':cut,
+      'travel_mm':travel,
+      'cut_seconds':60.0 * cut / feed,
+      'travel_seconds':60.0 * travel / rapid,
+      'pierce_seconds':pierce * len(paths),
+      }
+  estimate['total_seconds'] = (estimate['cut_seconds']
+      + estimate['travel_seconds'] + estimate['pierce_seconds'])
+  return estimate
+
+def write_dxf(paths, f, precision=4):
+  '''writes paths to the text file f as an R12 DXF, a CIRCLE for whole
+  circles and a POLYLINE for everything else, on a layer per unit'''
+  fmt = dial.number_formatter(precision)
+  def group(code, value):
+    f.write('%d\n%s\n' % (code, value))
+  group(0, 'SECTION')
+  group(2, 'ENTITIES')
+  for path in paths:
+    if path.circle is not None:
+      group(0, 'CIRCLE')
+      group(8, path.layer)
+      group(10, fmt(path.circle[0]))
+      group(20, fmt(path.circle[1]))
+      group(30, 0)
+      group(40, fmt(path.circle[2]))
+      continue
+    group(0, 'POLYLINE')
+    group(8, path.layer)
+    group(66, 1)
+    group(70, 1 if path.closed else 0)
+    for x, y in path.points:
+      group(0, 'VERTEX')
+      group(8, path.layer)
+      group(10, fmt(x))
+      group(20, fmt(y))
+      group(30, 0)
+    group(0, 'SEQEND')
+    group(8, path.layer)
+  group(0, 'ENDSEC')
+  group(0, 'EOF')
+
+def write_gcode(paths, f, feed=600.0, rapid=3000.0, safe_z=1.0, cut_z=-0.1,
+    power=None, precision=4):
+  '''
+  writes paths to the text file f as G-code in their order. Engraving
+  plunges to cut_z and retracts to safe_z, with power set the laser is
+  switched on and off with M3 S<power> / M5 instead.
+  '''
+  fmt = dial.number_formatter(precision)
+  f.write('G21\nG90\n')
+  if power is None:
+    f.write('G0 Z%s\n' % fmt(safe_z))
+  for path in paths:
+    f.write('(%s)\n' % path.layer)
+    f.write('G0 X%s Y%s F%s\n' % (fmt(path.start()[0]), fmt(path.start()[1]),
+        fmt(rapid)))
+    if power is None:
+      f.write('G1 Z%s F%s\n' % (fmt(cut_z), fmt(feed)))
+    else:
+      f.write('M3 S%s\n' % fmt(power))
+    points = path.points[1:] + path.points[:1] * path.closed
+    for i, (x, y) in enumerate(points):
+      if i:
+        f.write('G1 X%s Y%s\n' % (fmt(x), fmt(y)))
+      else:
+        f.write('G1 X%s Y%s F%s\n' % (fmt(x), fmt(y), fmt(feed)))
+    if power is None:
+      f.write('G0 Z%s\n' % fmt(safe_z))
+    else:
+      f.write('M5\n')
+  f.write('M2\n')
+
+def export(d, path, hands=False, scale=1.0, tolerance=0.01, feed=600.0,
+    rapid=3000.0, pierce=0.0, **options):
+  '''
+  writes the ordered toolpaths of dial d to path, as DXF if it ends in
+  .dxf and as G-code else, options go to write_gcode. Returns the
+  machine_time estimate.
+  '''
+  paths = order_toolpaths(toolpaths(d, hands, scale, tolerance))
+  with open(path, 'w') as f:
+    if path.lower().endswith('.dxf'):
+      write_dxf(paths, f)
+    else:
+      write_gcode(paths, f, feed, rapid, **options)
+  return machine_time(paths, feed, rapid, pierce)
+
+def report(name, estimate):
+  print('%-24s %5d paths %10.1f mm cut %10.1f mm travel %8.1fs' % (name,
+      estimate['toolpaths'], estimate['cut_mm'], estimate['travel_mm'],
+      estimate['total_seconds']))
+
+def main():
+  import argparse
+  import svgwrite
+  parser = argparse.ArgumentParser(
+      description='export a dial as DXF or G-code')
+  parser.add_argument('paths', nargs='+',
+      help='.dxf or .gcode files to write')
+  parser.add_argument('--mission-timer', action='store_true',
+      help='export a mission-timer.py style dial, default the test dial')
+  parser.add_argument('--scale', type=float, default=1.0,
+      help='millimeters per drawing unit, default 1')
+  parser.add_argument('--feed', type=float, default=600.0)
+  parser.add_argument('--rapid', type=float, default=3000.0)
+  parser.add_argument('--pierce', type=float, default=0.0)
+  parser.add_argument('--power', type=float, default=None,
+      help='laser power, engraves with Z moves if not set')
+  args = parser.parse_args()
+
+  centerx, centery, radius = 1200, 1200, 1000
+  drawing = svgwrite.Drawing('export.svg', size=(centerx*2, centery*2),
+      profile='full', fill='black', stroke='black')
+  if args.mission_timer:
+    d = dial.build_mission_timer(drawing, {})
+  else:
+    d = dial.dial(drawing, (centerx, centery), radius)
+  paths = toolpaths(d, scale=args.scale)
+  report('layout order', machine_time(paths, args.feed, args.rapid,
+      args.pierce))
+  for path in args.paths:
+    report(path, export(d, path, scale=args.scale, feed=args.feed,
+        rapid=args.rapid, pierce=args.pierce, power=args.power))
+
+if __name__ == '__main__':
+  main()
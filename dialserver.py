@@ -0,0 +1,204 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import sys
+import time
+
+import svgwrite
+
+import dial
+
+# Author: dlee@dlee.io / enkidu on watchuseek
+# Use of these files is free under the
+# [CC BY-SA 4.0](https://creativecommons.org/licenses/by-sa/4.0/) license.
+# Enjoy!
+
+# Serves the current time as svg dials over http. The track and indices of
+# every dial are serialized once, a request only renders the hands of its
+# time bucket, and recently served buckets are kept in a small LRU.
+#
+#   python dialserver.py [port]             serve the default dial
+#   python dialserver.py --load-test [n]    serve and hammer it locally
+
+class clock_face:
+  '''
+  the served renders of one dial. resolution is 'second', 'minute' or
+  'substep' (substeps buckets per second).
+  '''
+  def __init__(self, d, resolution='second', cache_size=64, clock=None):
+    self.dial = d
+    self.head, self.tail = d.static_layer()
+    self.tag = hashlib.sha1(self.head + self.tail).hexdigest()[:16]
+    if resolution == 'minute':
+      self.per_second = 1.0 / 60
+    elif resolution == 'substep':
+      self.per_second = d.substeps
+    else:
+      self.per_second = 1
+    self.cache_size = cache_size
+    self.cache = collections.OrderedDict()
+    self.clock = clock or datetime.datetime.now
+
+  def bucket(self, now):
+    '''the number of the time bucket of now since midnight'''
+    seconds = (now.hour * 3600 + now.minute * 60 + now.second
+        + now.microsecond / 1000000.0)
+    return int(seconds * self.per_second)
+
+  def render(self, bucket):
+    '''(etag, body) of bucket, from the LRU if possible'''
+    hit = self.cache.get(bucket)
+    if hit is not None:
+      self.cache.move_to_end(bucket)
+      return hit
+    seconds = bucket / float(self.per_second)
+    start = datetime.datetime.min + datetime.timedelta(seconds=seconds)
+    body = self.head + self.dial.hand_bytes(start.time()) + self.tail
+    etag = '"%s-%d"' % (self.tag, bucket)
+    self.cache[bucket] = etag, body
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+    return etag, body
+
+  def current(self):
+    '''(etag, body, max_age) of the current time'''
+    now = self.clock()
+    bucket = self.bucket(now)
+    etag, body = self.render(bucket)
+    seconds = (now.hour * 3600 + now.minute * 60 + now.second
+        + now.microsecond / 1000000.0)
+    max_age = int((bucket + 1) / float(self.per_second) - seconds)
+    return etag, body, max_age
+
+def response(status, headers, body=b''):
+  lines = ['HTTP/1.1 %s' % status]
+  lines.extend(['%s: %s' % header for header in headers])
+  return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+def etag_matches(if_none_match, etag):
+  if if_none_match is None:
+    return False
+  if if_none_match.strip() == '*':
+    return True
+  return etag in [tag.strip() for tag in if_none_match.split(',')]
+
+class dial_server:
+  '''an http server for a dict of url path to clock_face'''
+  def __init__(self, faces):
+    self.faces = faces
+    self.requests = 0
+
+  async def handle(self, reader, writer):
+    try:
+      while True:
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        method, path, version = (lines[0].split(' ') + ['', ''])[:3]
+        headers = {}
+        for line in lines[1:]:
+          if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('content-length'):
+          await reader.readexactly(int(headers['content-length']))
+        writer.write(self.respond(method, path.split('?')[0], headers))
+        self.requests += 1
+        if (headers.get('connection', '').lower() == 'close'
+            or version == 'HTTP/1.0'):
+          break
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+        ConnectionError):
+      pass
+    finally:
+      writer.close()
+
+  def respond(self, method, path, headers):
+    face = self.faces.get(path)
+    if face is None:
+      return response('404 Not Found', [('Content-Length', 0)])
+    if method not in ('GET', 'HEAD'):
+      return response('405 Method Not Allowed',
+          [('Allow', 'GET, HEAD'), ('Content-Length', 0)])
+    etag, body, max_age = face.current()
+    common = [('ETag', etag), ('Cache-Control', 'max-age=%d' % max_age)]
+    if etag_matches(headers.get('if-none-match'), etag):
+      return response('304 Not Modified', common)
+    return response('200 OK', common + [
+        ('Content-Type', 'image/svg+xml'),
+        ('Content-Length', len(body))],
+        body if method == 'GET' else b'')
+
+  async def start(self, host='127.0.0.1', port=8000):
+    return await asyncio.start_server(self.handle, host, port)
+
+def default_faces(resolution='second'):
+  centerx, centery, radius = 1200, 1200, 1000
+  drawing = svgwrite.Drawing('clock.svg',
+          size=(centerx*2, centery*2),
+          profile='full', fill='black', stroke='black')
+  return {'/': clock_face(dial.dial(drawing, (centerx, centery), radius),
+      resolution)}
+
+async def load_test(host, port, path='/', clients=50, requests=200,
+    revalidate=True):
+  '''
+  runs clients keep-alive connections that each send requests GETs,
+  revalidating with the last ETag if revalidate is set. Returns the number
+  of responses per status and the requests per second.
+  '''
+  statuses = collections.Counter()
+  async def client():
+    reader, writer = await asyncio.open_connection(host, port)
+    etag = None
+    for _ in range(requests):
+      request = 'GET %s HTTP/1.1\r\nHost: %s\r\n' % (path, host)
+      if revalidate and etag:
+        request += 'If-None-Match: %s\r\n' % etag
+      writer.write((request + '\r\n').encode('latin-1'))
+      head = await reader.readuntil(b'\r\n\r\n')
+      lines = head.decode('latin-1').split('\r\n')
+      length = 0
+      for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.lower() == 'content-length':
+          length = int(value)
+        elif name.lower() == 'etag':
+          etag = value.strip()
+      await reader.readexactly(length)
+      statuses[lines[0].split(' ')[1]] += 1
+    writer.close()
+  start = time.time()
+  await asyncio.gather(*[client() for _ in range(clients)])
+  elapsed = time.time() - start
+  return statuses, clients * requests / elapsed
+
+async def run_load_test(clients=50, requests=200):
+  server = dial_server(default_faces())
+  listener = await server.start(port=0)
+  port = listener.sockets[0].getsockname()[1]
+  for revalidate in (False, True):
+    statuses, rate = await load_test('127.0.0.1', port,
+        clients=clients, requests=requests, revalidate=revalidate)
+    print('%s: %d requests/s %s' % (
+        'revalidating' if revalidate else 'full', rate, dict(statuses)))
+  listener.close()
+  await listener.wait_closed()
+
+async def serve(port):
+  server = dial_server(default_faces())
+  listener = await server.start(port=port)
+  async with listener:
+    await listener.serve_forever()
+
+def main():
+  if sys.argv[1:2] == ['--load-test']:
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(run_load_test(clients))
+    return
+  port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+  asyncio.run(serve(port))
+
+if __name__ == '__main__':
+  main()
@@ -7,6 +7,7 @@
 # License: GPLv3
 
 import math
+from array import array
 
 import svgwrite
 from svgwrite import cm, mm, rgb, deg
@@ -221,63 +222,79 @@ def pattern_drawing(name):
     dwg.add(dwg.circle((100, 100), 50, fill=pattern.get_paint_server()))
     dwg.save()
 
-def koch_snowflake(name):
-    # Koch Snowflake and Sierpinski Triangle combination fractal using recursion
-    # ActiveState Recipe 577156
-    # Created by FB36 on Sat, 27 Mar 2010 (MIT)
-    # http://code.activestate.com/recipes/577156-koch-snowflake-and-sierpinski-triangle-combination/
-
-    def tf (x0, y0, x1, y1, x2, y2):
-        a = math.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
-        b = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-        c = math.sqrt((x0 - x2) ** 2 + (y0 - y2) ** 2)
-
-        if (a < stop_val) or (b < stop_val) or (c < stop_val):
-            return
-
-        x3 = (x0 + x1) / 2
-        y3 = (y0 + y1) / 2
-        x4 = (x1 + x2) / 2
-        y4 = (y1 + y2) / 2
-        x5 = (x2 + x0) / 2
-        y5 = (y2 + y0) / 2
-        points = [(x3, y3), (x4, y4), (x5, y5)]
-
-        # append new polygon to snowflake element
-        snowflake.add(dwg.polygon(points))
-        tf(x0, y0, x3, y3, x5, y5)
-        tf(x3, y3, x1, y1, x4, y4)
-        tf(x5, y5, x4, y4, x2, y2)
-
-    def sf (ax, ay, bx, by):
-        f = math.sqrt((bx - ax) ** 2 + (by - ay) ** 2)
-
+def koch_triangles(edges, triangles=(), stop_val=8., depth=None):
+    # the triangles of the Koch snowflake / Sierpinski triangle combination
+    # on the (ax, ay, bx, by) edges, followed by the Sierpinski triangles
+    # inside the (x0, y0, x1, y1, x2, y2) triangles, as one array of
+    # x0, y0, x1, y1, x2, y2 per triangle. An explicit stack replaces the
+    # recursion of the original recipe, so deep fractals neither hit the
+    # recursion limit nor build an element per triangle. depth limits the
+    # subdivision levels, None subdivides until the sides are smaller than
+    # stop_val.
+    coords = array('d')
+    # popped from the end, so everything is pushed in reverse to come out
+    # in the order of the recursive version
+    stack = [(True, 0) + tuple(t) for t in reversed(triangles)]
+    stack += [(False, 0) + tuple(e) + (0., 0.) for e in reversed(edges)]
+    while stack:
+        triangle, level, x0, y0, x1, y1, x2, y2 = stack.pop()
+        if depth is not None and level > depth:
+            continue
+        if triangle:
+            if (math.hypot(x1 - x0, y1 - y0) < stop_val
+                    or math.hypot(x2 - x1, y2 - y1) < stop_val
+                    or math.hypot(x0 - x2, y0 - y2) < stop_val):
+                continue
+            x3 = (x0 + x1) / 2
+            y3 = (y0 + y1) / 2
+            x4 = (x1 + x2) / 2
+            y4 = (y1 + y2) / 2
+            x5 = (x2 + x0) / 2
+            y5 = (y2 + y0) / 2
+            coords.extend((x3, y3, x4, y4, x5, y5))
+            stack.append((True, level + 1, x5, y5, x4, y4, x2, y2))
+            stack.append((True, level + 1, x3, y3, x1, y1, x4, y4))
+            stack.append((True, level + 1, x0, y0, x3, y3, x5, y5))
+            continue
+        f = math.hypot(x1 - x0, y1 - y0)
         if f < 1.:
-            return
-
+            continue
         f3 = f / 3
-        cs = (bx - ax) / f
-        sn = (by - ay) / f
-        cx = ax + cs * f3
-        cy = ay + sn * f3
+        cs = (x1 - x0) / f
+        sn = (y1 - y0) / f
+        cx = x0 + cs * f3
+        cy = y0 + sn * f3
         h = f3 * math.sqrt(3) / 2
-        dx = (ax + bx) / 2 + sn * h
-        dy = (ay + by) / 2 - cs * h
-        ex = bx - cs * f3
-        ey = by - sn * f3
-        tf(cx, cy, dx, dy, ex, ey)
-        sf(ax, ay, cx, cy)
-        sf(cx, cy, dx, dy)
-        sf(dx, dy, ex, ey)
-        sf(ex, ey, bx, by)
+        dx = (x0 + x1) / 2 + sn * h
+        dy = (y0 + y1) / 2 - cs * h
+        ex = x1 - cs * f3
+        ey = y1 - sn * f3
+        stack.append((False, level + 1, ex, ey, x1, y1, 0., 0.))
+        stack.append((False, level + 1, dx, dy, ex, ey, 0., 0.))
+        stack.append((False, level + 1, cx, cy, dx, dy, 0., 0.))
+        stack.append((False, level + 1, x0, y0, cx, cy, 0., 0.))
+        stack.append((True, level, cx, cy, dx, dy, ex, ey))
+    return coords
+
+def triangle_path(coords, precision=2):
+    # the path data of one closed subpath per triangle in coords
+    number = '%%.%df' % precision
+    triangle = 'M%s %sL%s %sL%s %sZ' % ((number,) * 6)
+    return triangle * (len(coords) // 6) % tuple(coords)
+
+def koch_snowflake(name, stop_val=8., depth=None, precision=2):
+    # Koch Snowflake and Sierpinski Triangle combination fractal
+    # ActiveState Recipe 577156
+    # Created by FB36 on Sat, 27 Mar 2010 (MIT)
+    # http://code.activestate.com/recipes/577156-koch-snowflake-and-sierpinski-triangle-combination/
 
     # const values
-    stop_val = 8.
     imgx = 512
     imgy = 512
 
-    # create a new drawing
-    dwg = svgwrite.Drawing(name, (imgx, imgy), profile='tiny', debug=DEBUG)
+    # create a new drawing, without debug: validating the path data of
+    # every triangle takes far more memory than the drawing itself
+    dwg = svgwrite.Drawing(name, (imgx, imgy), profile='tiny', debug=False)
 
     # create a new <g /> element, we will insert the snowflake by the <use /> element
     # here we set stroke, fill and stroke-width for all subelements
@@ -293,16 +310,20 @@ def koch_snowflake(name):
     my2 = imgy / 2
     r = my2
     a = 2 * math.pi / 3
+    edges = []
     for k in range(3):
         x0 = mx2 + r * math.cos(a * k)
         y0 = my2 + r * math.sin(a * k)
         x1 = mx2 + r * math.cos(a * (k + 1))
         y1 = my2 + r * math.sin(a * (k + 1))
-        sf(x0, y0, x1, y1)
+        edges.append((x0, y0, x1, y1))
 
     x2 = mx2 + r * math.cos(a)
     y2 = my2 + r * math.sin(a)
-    tf(x0, y0, x1, y1, x2, y2)
+    coords = koch_triangles(edges, [(x0, y0, x1, y1, x2, y2)], stop_val, depth)
+
+    # all triangles as the subpaths of a single path
+    snowflake.add(dwg.path(d=triangle_path(coords, precision)))
 
     # create an <use /> element
     use_snowflake = dwg.use(snowflake)
@@ -316,17 +337,37 @@ def koch_snowflake(name):
     # and save the drawing
     dwg.save()
 
-def mandelbrot(name):
+def mandelbrot_iterations(xa, xb, ya, yb, imgx, imgy, maxIt=255):
+    # escape time kernel vectorized with numpy: for every pixel the first
+    # iteration at which abs(z) > 2, maxIt - 1 if it never escapes. Points
+    # are dropped from the arrays as soon as they escape.
+    import numpy
+    zx = numpy.arange(imgx) * (xb - xa) / (imgx - 1) + xa
+    zy = numpy.arange(imgy) * (yb - ya) / (imgy - 1) + ya
+    c = (zx[None, :] + zy[:, None] * 1j).ravel()
+    z = c.copy()
+    index = numpy.arange(c.size)
+    iterations = numpy.full(c.size, maxIt - 1, dtype=numpy.int64)
+    for i in range(maxIt):
+        escaped = numpy.abs(z) > 2.0
+        if escaped.any():
+            iterations[index[escaped]] = i
+            active = ~escaped
+            index, z, c = index[active], z[active], c[active]
+            if not index.size:
+                break
+        z = z * z + c
+    return iterations.reshape(imgy, imgx)
+
+def mandelbrot(name, imgx=160, imgy=100, layer='png'):
     ## {{{ http://code.activestate.com/recipes/577111/ (r2)
     # Mandelbrot fractal
     # FB - 201003254
-
-    def putpixel(pos, color):
-        mandelbrot_group.add(dwg.circle(center=pos, r=.5, fill=color))
-
-    # image size
-    imgx = 160
-    imgy = 100
+    #
+    # layer 'png' embeds the pixels as an <image>, 'rects' draws one <rect>
+    # per run of equal pixels in a row, see raster.py
+    import numpy
+    import raster
 
     # drawing defines the output size
     dwg = svgwrite.Drawing(name, ('32cm', '20cm'), debug=DEBUG)
@@ -334,8 +375,6 @@ def mandelbrot(name):
     # define a user coordinate system with viewbox()
     dwg.viewbox(0, 0, imgx, imgy)
 
-    mandelbrot_group = dwg.add(dwg.g(stroke_width=0, stroke='none'))
-
     # drawing area
     xa = -2.0
     xb = 1.0
@@ -343,16 +382,12 @@ def mandelbrot(name):
     yb = 1.5
     maxIt = 255 # max iterations allowed
 
-    for y in range(imgy):
-        zy = y * (yb - ya) / (imgy - 1)  + ya
-        for x in range(imgx):
-            zx = x * (xb - xa) / (imgx - 1)  + xa
-            z = zx + zy * 1j
-            c = z
-            for i in range(maxIt):
-                if abs(z) > 2.0: break
-                z = z * z + c
-            putpixel((x, y), rgb(i % 4 * 64, i % 8 * 32, i % 16 * 16))
+    i = mandelbrot_iterations(xa, xb, ya, yb, imgx, imgy, maxIt)
+    pixels = numpy.dstack([i % 4 * 64, i % 8 * 32, i % 16 * 16]).astype(numpy.uint8)
+    if layer == 'rects':
+        dwg.add(raster.rect_layer(dwg, pixels))
+    else:
+        dwg.add(raster.image_layer(dwg, pixels))
     dwg.save()
     ## end of http://code.activestate.com/recipes/577111/ }}}
 
@@ -373,77 +408,87 @@ HilbertSpaceFillingCurve = {'length':1, 'numAngle':4, 'level':5, 'init': 'L',
              'target': 'L', 'replacement': '+RF-LFL-FR+', 'target2': 'R',
              'replacement2': '-LF+RFR+FL-'}
 
-def LSystem(name, formula=LevyCurve):
-    ## {{{ http://code.activestate.com/recipes/577159/ (r1)
-    # L-System Fractals
-    # FB - 201003276
-    # image size
-
-    # generate the fractal drawing string
-    def _LSystem(formula):
-        state = formula['init']
-        target = formula['target']
-        replacement = formula['replacement']
-        target2 = formula['target2']
-        replacement2 = formula['replacement2']
+def expand_lsystem(formula, level=None):
+    # yields the characters of the fractal drawing string one by one. The
+    # rewrite tree is walked with a stack of iterators, one per generation,
+    # so no generation is ever built as a string.
+    rules = {}
+    if formula['target']:
+        rules[formula['target']] = formula['replacement']
+    if formula['target2']:
+        rules[formula['target2']] = formula['replacement2']
+    if level is None:
         level = formula['level']
-
-        for counter in range(level):
-            state2 = ''
-            for character in state:
-                if character == target:
-                    state2 += replacement
-                elif character == target2:
-                    state2 += replacement2
-                else:
-                    state2 += character
-            state = state2
-        return state
-    print("creating: %s\n" % name)
-    xmin, ymin = (100000, 100000)
-    xmax, ymax = (-100000, -100000)
-
+    stack = [iter(formula['init'])]
+    while stack:
+        for character in stack[-1]:
+            if len(stack) <= level and character in rules:
+                stack.append(iter(rules[character]))
+                break
+            yield character
+        else:
+            stack.pop()
+
+def lsystem_points(formula, level=None, progress=None, every=65536):
+    # runs the turtle over expand_lsystem and returns the x and y
+    # coordinates of the curve as two array('d'). progress is called with
+    # the number of segments so far every `every` segments.
     numAngle = formula['numAngle']
     length = formula['length']
-    fractal = _LSystem(formula)
     na = 2.0 * math.pi / numAngle
-    sn = []
-    cs = []
-    for i in range(numAngle):
-        sn.append(math.sin(na * i))
-        cs.append(math.cos(na * i))
+    steps = [(length * math.cos(na * i), length * math.sin(na * i))
+             for i in range(numAngle)]
 
     x = 0.0
     y = 0.0
-
-    # jx = int((x - xa) / (xb - xa) * (imgx - 1))
-    # jy = int((y - ya) / (yb - ya) * (imgy - 1))
+    xs = array('d', [x])
+    ys = array('d', [y])
     k = 0
-    dwg = svgwrite.Drawing(name, debug=DEBUG)
-    curve = dwg.polyline(points=[(x, y)], stroke='green', fill='none', stroke_width=0.1)
-    for ch in fractal:
+    for ch in expand_lsystem(formula, level):
         if ch == 'F':
             # turtle forward(length)
-            x +=  length * cs[k]
-            y += length * sn[k]
-
-            curve.points.append( (x, y) )
-
-            # find maxima
-            xmin = min(xmin, x)
-            xmax = max(xmax, x)
-            ymin = min(ymin, y)
-            ymax = max(ymax, y)
+            x += steps[k][0]
+            y += steps[k][1]
+            xs.append(x)
+            ys.append(y)
+            if progress is not None and (len(xs) - 1) % every == 0:
+                progress(len(xs) - 1)
         elif ch == '+':
             # turtle right(angle)
             k = (k + 1) % numAngle
         elif ch == '-':
             # turtle left(angle)
             k = ((k - 1) + numAngle) % numAngle
-    print("L-System with %d segements.\n" % (len(curve.points)-1))
+    if progress is not None:
+        progress(len(xs) - 1)
+    return xs, ys
+
+def LSystem(name, formula=LevyCurve, progress=None):
+    ## {{{ http://code.activestate.com/recipes/577159/ (r1)
+    # L-System Fractals
+    # FB - 201003276
+    # image size
+    print("creating: %s\n" % name)
+    xs, ys = lsystem_points(formula, progress=progress)
+    xmin, xmax = min(xs), max(xs)
+    ymin, ymax = min(ys), max(ys)
+    print("L-System with %d segements.\n" % (len(xs)-1))
+
+    dwg = svgwrite.Drawing(name, debug=DEBUG)
     dwg.viewbox(xmin, ymin, xmax-xmin, ymax-ymin)
-    dwg.add(curve)
-    dwg.save()
+    # the curve is serialized with its first point only, the rest of the
+    # points are streamed into the file after it
+    first = '%s,%s' % (xs[0], ys[0])
+    dwg.add(dwg.polyline(points=[(xs[0], ys[0])], stroke='green', fill='none', stroke_width=0.1))
+    head, tail = dwg.tostring().split('points="%s' % first, 1)
+    with open(name, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        f.write(head + 'points="' + first)
+        for start in range(1, len(xs), 4096):
+            f.write(' ')
+            f.write(' '.join(['%s,%s' % point for point in
+                              zip(xs[start:start + 4096], ys[start:start + 4096])]))
+        f.write(tail)
 ## end of http://code.activestate.com/recipes/577159/ }}}
 
 def simple_text(name):
@@ -0,0 +1,461 @@
+import base64
+import math
+import re
+import struct
+import zlib
+
+import numpy
+
+import dial
+
+# Author: dlee@dlee.io / enkidu on watchuseek
+# Use of these files is free under the
+# [CC BY-SA 4.0](https://creativecommons.org/licenses/by-sa/4.0/) license.
+# Enjoy!
+
+# A small anti-aliased rasterizer for dial previews. Shapes come from
+# dial.element_shapes, are flattened to polygons and filled by counting edge
+# crossings on a supersampled grid. Circles (the track and round indices)
+# are drawn analytically.
+
+named_colors = {
+    'black':(0, 0, 0),
+    'white':(255, 255, 255),
+    'red':(255, 0, 0),
+    'green':(0, 128, 0),
+    'lime':(0, 255, 0),
+    'blue':(0, 0, 255),
+    'yellow':(255, 255, 0),
+    'orange':(255, 165, 0),
+    'gray':(128, 128, 128),
+    'grey':(128, 128, 128),
+    'lightgray':(211, 211, 211),
+    'lightgrey':(211, 211, 211),
+    'darkgray':(169, 169, 169),
+    'darkgrey':(169, 169, 169),
+    'silver':(192, 192, 192),
+    'navy':(0, 0, 128),
+    'maroon':(128, 0, 0),
+    'purple':(128, 0, 128),
+    'lightblue':(173, 216, 230),
+    }
+
+def parse_color(value):
+  '''an svg color as an rgb triple of floats, None for none'''
+  value = str(value).strip().lower()
+  if value in ('none', 'transparent', ''):
+    return None
+  if value.startswith('#'):
+    value = value[1:]
+    if len(value) == 3:
+      value = ''.join([c * 2 for c in value])
+    return tuple([int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4)])
+  if value.startswith('rgb('):
+    parts = value[4:-1].split(',')
+    return tuple([float(p.strip('% ')) / (100.0 if '%' in p else 255.0)
+        for p in parts[:3]])
+  rgb = named_colors.get(value, (0, 0, 0))
+  return tuple([c / 255.0 for c in rgb])
+
+def flatten(commands, tolerance=0.25):
+  '''
+  absolute path commands as a list of (points, closed) polylines, with
+  curves and arcs approximated to within tolerance pixels
+  '''
+  polylines = []
+  points, closed = [], False
+  x = y = 0.0
+  for command in commands:
+    op = command[0]
+    if op == 'M':
+      if len(points) > 1:
+        polylines.append((points, closed))
+      points, closed = [command[1:3]], False
+    elif op == 'Z':
+      closed = True
+      if len(points) > 1:
+        polylines.append((points, closed))
+      points = [points[0]] if points else []
+      closed = False
+    elif op == 'L':
+      points.append(command[1:3])
+    elif op in 'CQ':
+      controls = [(x, y)] + [command[i:i + 2] for i in range(1, len(command), 2)]
+      length = sum([math.hypot(b[0] - a[0], b[1] - a[1])
+          for a, b in zip(controls, controls[1:])])
+      n = max(2, min(256, int(math.sqrt(length / tolerance)) + 1))
+      t = numpy.linspace(0, 1, n + 1)[1:, None]
+      p = numpy.array(controls, dtype=float)
+      if op == 'C':
+        curve = ((1 - t) ** 3 * p[0] + 3 * (1 - t) ** 2 * t * p[1]
+            + 3 * (1 - t) * t ** 2 * p[2] + t ** 3 * p[3])
+      else:
+        curve = (1 - t) ** 2 * p[0] + 2 * (1 - t) * t * p[1] + t ** 2 * p[2]
+      points.extend(map(tuple, curve.tolist()))
+    elif op == 'A':
+      center = dial.arc_center(x, y, *command[1:])
+      if center is None:
+        points.append(command[6:8])
+      else:
+        r = max(center[2], center[3])
+        step = 2 * math.acos(max(-1.0, 1 - tolerance / r)) if r > tolerance else math.pi / 2
+        n = max(2, int(math.ceil(abs(center[6]) / max(step, 1e-3))))
+        for i in range(1, n):
+          points.append(dial.arc_point(center, center[5] + center[6] * i / n))
+        points.append(command[6:8])
+    if op != 'Z':
+      x, y = points[-1] if points else (x, y)
+    else:
+      x, y = points[0] if points else (x, y)
+  if len(points) > 1:
+    polylines.append((points, closed))
+  return polylines
+
+def fill_edges(polylines):
+  '''the edges of the filled area of polylines as an (n, 4) array of
+  x1, y1, x2, y2, every polyline is closed'''
+  edges = []
+  for points, closed in polylines:
+    p = numpy.array(points, dtype=float)
+    edges.append(numpy.hstack((p, numpy.roll(p, -1, axis=0))))
+  if not edges:
+    return numpy.zeros((0, 4))
+  return numpy.vstack(edges)
+
+def stroke_edges(polylines, width):
+  '''
+  the outline of the stroke of polylines as edges: a quad around every
+  segment and an octagon around every point as a round join, all turning
+  the same way so that they add up with the nonzero fill rule
+  '''
+  half = width / 2.0
+  rings = []
+  for points, closed in polylines:
+    p = numpy.array(points, dtype=float)
+    a = p if closed else p[:-1]
+    b = numpy.roll(p, -1, axis=0) if closed else p[1:]
+    d = b - a
+    length = numpy.hypot(d[:, 0], d[:, 1])
+    keep = length > 0
+    a, b, d, length = a[keep], b[keep], d[keep], length[keep]
+    n = numpy.column_stack((-d[:, 1], d[:, 0])) / length[:, None] * half
+    rings.append(numpy.stack((a + n, b + n, b - n, a - n), axis=1))
+    t = numpy.arange(8) * (math.pi / 4)
+    octagon = numpy.column_stack((numpy.cos(t), numpy.sin(t))) * half
+    rings.append(p[:, None, :] + octagon[None, :, :])
+  edges = []
+  for ring in rings:
+    if not len(ring):
+      continue
+    x, y = ring[:, :, 0], ring[:, :, 1]
+    area = (x * numpy.roll(y, -1, axis=1) - numpy.roll(x, -1, axis=1) * y).sum(axis=1)
+    ring = numpy.where((area < 0)[:, None, None], ring[:, ::-1], ring)
+    nxt = numpy.roll(ring, -1, axis=1)
+    edges.append(numpy.concatenate((ring, nxt), axis=2).reshape(-1, 4))
+  if not edges:
+    return numpy.zeros((0, 4))
+  return numpy.vstack(edges)
+
+def polygon_coverage(edges, nonzero, width, height, supersample=4):
+  '''
+  the coverage of the area enclosed by edges, clipped to width x height, as
+  (y0, x0, mask). Every pixel is sampled supersample x supersample times,
+  the winding number of the samples is found by adding up the directions of
+  the edge crossings along each sample row.
+  '''
+  if not len(edges):
+    return None
+  ss = supersample
+  x1, y1, x2, y2 = edges.T
+  px0 = max(0, int(math.floor(min(x1.min(), x2.min()))))
+  py0 = max(0, int(math.floor(min(y1.min(), y2.min()))))
+  px1 = min(width, int(math.ceil(max(x1.max(), x2.max()))))
+  py1 = min(height, int(math.ceil(max(y1.max(), y2.max()))))
+  if px1 <= px0 or py1 <= py0:
+    return None
+  rows, cols = (py1 - py0) * ss, (px1 - px0) * ss
+  # sample row i is at py0 + (i + 0.5) / ss, an edge crosses the rows in
+  # [min(y1, y2), max(y1, y2))
+  top = numpy.ceil((numpy.minimum(y1, y2) - py0) * ss - 0.5)
+  bottom = numpy.ceil((numpy.maximum(y1, y2) - py0) * ss - 0.5)
+  top = top.clip(0, rows).astype(numpy.int64)
+  count = bottom.clip(0, rows).astype(numpy.int64) - top
+  keep = count > 0
+  edge = numpy.repeat(numpy.nonzero(keep)[0], count[keep])
+  first = numpy.cumsum(count[keep]) - count[keep]
+  row = (numpy.repeat(top[keep], count[keep])
+      + numpy.arange(len(edge)) - numpy.repeat(first, count[keep]))
+  sy = py0 + (row + 0.5) / ss
+  ex1, ey1, ex2, ey2 = x1[edge], y1[edge], x2[edge], y2[edge]
+  sx = ex1 + (sy - ey1) * (ex2 - ex1) / (ey2 - ey1)
+  # the crossing counts for the samples right of it
+  col = (numpy.floor((sx - px0) * ss - 0.5) + 1).clip(0, cols).astype(numpy.int64)
+  direction = numpy.where(ey2 > ey1, 1, -1)
+  mask = numpy.zeros((py1 - py0, px1 - px0), dtype=numpy.float32)
+  band = max(ss, (1 << 20) // (cols + 1) // ss * ss)
+  for r0 in range(0, rows, band):
+    r1 = min(rows, r0 + band)
+    sel = (row >= r0) & (row < r1)
+    winding = numpy.bincount((row[sel] - r0) * (cols + 1) + col[sel],
+        weights=direction[sel], minlength=(r1 - r0) * (cols + 1))
+    winding = winding.reshape(r1 - r0, cols + 1)[:, :cols].cumsum(axis=1)
+    if nonzero:
+      inside = winding != 0
+    else:
+      inside = winding.astype(numpy.int64) % 2 == 1
+    mask[r0 // ss:r1 // ss] = inside.reshape(
+        (r1 - r0) // ss, ss, cols // ss, ss).mean(axis=(1, 3))
+  return py0, px0, mask
+
+def disc_coverage(cx, cy, r, width, height):
+  '''the coverage of a disc as (y0, x0, mask), anti-aliased over one pixel'''
+  x0, y0 = max(0, int(cx - r - 1)), max(0, int(cy - r - 1))
+  x1 = min(width, int(math.ceil(cx + r + 1)))
+  y1 = min(height, int(math.ceil(cy + r + 1)))
+  if x1 <= x0 or y1 <= y0:
+    return None
+  ys = numpy.arange(y0, y1, dtype=numpy.float32)[:, None] + 0.5 - cy
+  xs = numpy.arange(x0, x1, dtype=numpy.float32)[None, :] + 0.5 - cx
+  mask = (r + 0.5 - numpy.sqrt(xs * xs + ys * ys)).clip(0, 1)
+  return y0, x0, mask
+
+def ring_coverage(cx, cy, r, stroke_width, width, height):
+  '''the coverage of the stroke of a circle as (y0, x0, mask)'''
+  outer = disc_coverage(cx, cy, r + stroke_width / 2.0, width, height)
+  if outer is None or r - stroke_width / 2.0 <= 0:
+    return outer
+  y0, x0, mask = outer
+  inner = disc_coverage(cx, cy, r - stroke_width / 2.0, width, height)
+  if inner is not None:
+    iy, ix, imask = inner
+    h, w = imask.shape
+    mask = mask.copy()
+    mask[iy - y0:iy - y0 + h, ix - x0:ix - x0 + w] -= imask
+  return y0, x0, mask.clip(0, 1)
+
+def shape_layers(s, width, height, supersample=4):
+  '''
+  the fill and stroke coverage of a shape in pixel coordinates as a list of
+  (y0, x0, mask, rgb) layers
+  '''
+  layers = []
+  fill, stroke = parse_color(s.fill), parse_color(s.stroke)
+  polylines = None
+  if fill is not None:
+    if s.circle is not None:
+      coverage = disc_coverage(s.circle[0], s.circle[1], s.circle[2], width, height)
+    else:
+      polylines = flatten(s.commands)
+      coverage = polygon_coverage(fill_edges(polylines),
+          s.fill_rule != 'evenodd', width, height, supersample)
+    if coverage is not None:
+      layers.append(coverage + (fill,))
+  if stroke is not None and s.stroke_width > 0:
+    if s.circle is not None:
+      coverage = ring_coverage(s.circle[0], s.circle[1], s.circle[2],
+          s.stroke_width, width, height)
+    else:
+      if polylines is None:
+        polylines = flatten(s.commands)
+      coverage = polygon_coverage(stroke_edges(polylines, s.stroke_width),
+          True, width, height, supersample)
+    if coverage is not None:
+      layers.append(coverage + (stroke,))
+  return layers
+
+def rotate_layers(layers, turns, cx, cy):
+  '''
+  rotates coverage layers by turns quarter turns clockwise around the pixel
+  position cx, cy, which has to lie on a pixel corner or center
+  '''
+  rotated = []
+  for y0, x0, mask, rgb in layers:
+    for _ in range(turns % 4):
+      h, w = mask.shape
+      y0, x0 = int(round(cy - cx + x0)), int(round(cx + cy - y0 - h))
+      mask = numpy.rot90(mask, -1)
+    rotated.append((y0, x0, mask, rgb))
+  return rotated
+
+class canvas:
+  '''
+  a premultiplied RGBA float image that coverage layers are composited on
+  '''
+  def __init__(self, width, height, supersample=4):
+    self.width = width
+    self.height = height
+    self.supersample = supersample
+    self.rgb = numpy.zeros((height, width, 3), dtype=numpy.float32)
+    self.alpha = numpy.zeros((height, width), dtype=numpy.float32)
+
+  def draw(self, shapes):
+    for s in shapes:
+      self.composite(shape_layers(s, self.width, self.height, self.supersample))
+
+  def composite(self, layers):
+    for y0, x0, mask, rgb in layers:
+      h, w = mask.shape
+      # clip the layer to the canvas
+      cy0, cx0 = max(0, y0), max(0, x0)
+      cy1, cx1 = min(self.height, y0 + h), min(self.width, x0 + w)
+      if cy1 <= cy0 or cx1 <= cx0:
+        continue
+      a = mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+      alpha = self.alpha[cy0:cy1, cx0:cx1]
+      color = self.rgb[cy0:cy1, cx0:cx1]
+      color *= (1 - a)[:, :, None]
+      color += a[:, :, None] * numpy.array(rgb, dtype=numpy.float32)
+      alpha *= 1 - a
+      alpha += a
+
+  def pixels(self):
+    '''the image as an (height, width, 4) uint8 RGBA array'''
+    alpha = self.alpha[:, :, None]
+    rgb = numpy.where(alpha > 0, self.rgb / numpy.maximum(alpha, 1e-6), 0)
+    out = numpy.concatenate((rgb, alpha), axis=2)
+    return (out.clip(0, 1) * 255 + 0.5).astype(numpy.uint8)
+
+def view_matrix(dwg, width, height):
+  '''the matrix from the user coordinates of dwg to width x height pixels'''
+  size = dwg.attribs.get('width'), dwg.attribs.get('height')
+  viewbox = dwg.attribs.get('viewBox')
+  if viewbox:
+    vx, vy, vw, vh = [float(v) for v in re.findall(dial._number_pattern, str(viewbox))]
+  else:
+    vx, vy = 0.0, 0.0
+    try:
+      vw, vh = float(size[0]), float(size[1])
+    except (TypeError, ValueError):
+      vw, vh = float(width), float(height)
+  sx, sy = float(width) / vw, float(height) / vh
+  return (sx, 0.0, 0.0, sy, -vx * sx, -vy * sy)
+
+def render_dial(d, width, height, supersample=4):
+  '''
+  rasterizes a dial.dial at its dtime into a (height, width, 4) uint8 RGBA
+  array. The index coverage is kept in d._masks and reused by later renders
+  of the same dial, by the serialized unit, so changed units get new masks.
+  Indices a quarter turn apart share one mask if the center of the dial
+  falls on a pixel corner or center.
+  '''
+  view = view_matrix(d.dwg, width, height)
+  style = dial.drawing_style(d.dwg)
+  image = canvas(width, height, supersample)
+  units = d.units()
+  if units['track']:
+    image.draw(dial.element_shapes(units['track'],
+        dial.multiply_matrices(view, d.track_placement().matrix()), style))
+
+  cx, cy = dial.apply_matrix(view, d.center[0], d.center[1])
+  quarter = (view[0] == view[3] and view[1] == view[2] == 0
+      and (cx * 2) % 1 == 0 and (cx + cy) % 1 == 0)
+  masks = getattr(d, '_masks', None)
+  if masks is None:
+    masks = d._masks = {}
+  contents = {}
+  styles = tuple(sorted(style.items()))
+  for p in d.index_placements():
+    unit = units[p.unit]
+    if not unit:
+      continue
+    angle = p.angle
+    turns = 0
+    if quarter:
+      turns = int(angle // 90)
+      angle = round(angle - 90 * turns, 9)
+      if angle >= 90:
+        angle, turns = round(angle - 90, 9), turns + 1
+    if p.unit not in contents:
+      contents[p.unit] = unit.tostring()
+    key = (contents[p.unit], styles, angle, view, supersample, d.center,
+        d.radius)
+    layers = masks.get(key)
+    if layers is None:
+      m = dial.multiply_matrices(view,
+          dial.placement_matrix(d.center, d.radius, angle))
+      layers = []
+      for s in dial.element_shapes(unit, m, style):
+        layers.extend(shape_layers(s, width, height, supersample))
+      masks[key] = layers
+    if turns:
+      layers = rotate_layers(layers, turns, cx, cy)
+    image.composite(layers)
+
+  for p in d.hand_placements(d.dtime):
+    if not units[p.unit]:
+      continue
+    m = dial.multiply_matrices(view, p.matrix())
+    image.draw(dial.element_shapes(units[p.unit], m, style))
+  return image.pixels()
+
+def encode_png(pixels, level=6):
+  '''
+  encodes an (height, width, 4) RGBA or (height, width, 3) RGB uint8 array
+  as png, using only zlib and struct
+  '''
+  pixels = numpy.ascontiguousarray(pixels, dtype=numpy.uint8)
+  height, width, channels = pixels.shape
+  raw = numpy.zeros((height, width * channels + 1), dtype=numpy.uint8)
+  raw[:, 1:] = pixels.reshape(height, -1)
+  def chunk(tag, data):
+    return (struct.pack('>I', len(data)) + tag + data
+        + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+  color_type = {3:2, 4:6}[channels]
+  return (b'\x89PNG\r\n\x1a\n'
+      + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+      + chunk(b'IDAT', zlib.compress(raw.tobytes(), level))
+      + chunk(b'IEND', b''))
+
+def write_png(path, pixels, level=6):
+  '''writes pixels as a png file'''
+  with open(path, 'wb') as f:
+    f.write(encode_png(pixels, level))
+
+# Raster layers put dense per pixel data, pixels as (height, width, 3) RGB or
+# (height, width, 4) RGBA uint8 arrays, into a drawing without an element
+# per pixel.
+
+def png_data_uri(pixels, level=6):
+  '''pixels as a base64 png data uri'''
+  return 'data:image/png;base64,' + base64.b64encode(
+      encode_png(pixels, level)).decode('ascii')
+
+def image_layer(dwg, pixels, insert=(0, 0), size=None, level=6):
+  '''
+  an image element showing pixels as an embedded png at insert, stretched
+  to size (one user unit per pixel by default) without smoothing
+  '''
+  height, width = pixels.shape[:2]
+  if size is None:
+    size = (width, height)
+  image = dwg.image(png_data_uri(pixels, level), insert=insert, size=size)
+  image['preserveAspectRatio'] = 'none'
+  image['image-rendering'] = 'optimizeSpeed'
+  return image
+
+def rect_layer(dwg, pixels, insert=(0, 0), scale=1):
+  '''
+  a group of rects showing pixels, one rect per run of equal pixels in a
+  row, scale user units per pixel. Fully transparent runs are left out.
+  '''
+  pixels = numpy.ascontiguousarray(pixels, dtype=numpy.uint8)
+  height, width, channels = pixels.shape
+  if channels == 3:
+    alpha = numpy.full((height, width, 1), 255, dtype=numpy.uint8)
+    pixels = numpy.concatenate([pixels, alpha], axis=2)
+  keys = pixels.view('>u4')[:, :, 0]
+  group = dwg.g(stroke='none')
+  for y in range(height):
+    row = keys[y]
+    starts = numpy.flatnonzero(numpy.r_[True, row[1:] != row[:-1]])
+    ends = numpy.r_[starts[1:], width]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+      r, g, b, a = pixels[y, start].tolist()
+      if not a:
+        continue
+      rect = dwg.rect((insert[0] + start * scale, insert[1] + y * scale),
+          ((end - start) * scale, scale), fill='#%02x%02x%02x' % (r, g, b))
+      if a < 255:
+        rect['fill-opacity'] = round(a / 255.0, 3)
+      group.add(rect)
+  return group